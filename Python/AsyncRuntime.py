@@ -0,0 +1,201 @@
+import asyncio
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import paho.mqtt.client as mqtt
+
+class MqttAsyncBridge:
+    def __init__(self, loop, mqtt_handler, misc_interval=1):
+        """
+        Drive a paho client from an asyncio event loop instead of paho's network thread.
+        The client's socket is registered with the loop, which calls loop_read/loop_write when it is ready.
+        :param loop: The running event loop.
+        :param mqtt_handler: MQTTHandler created with start_loop=False.
+        :param misc_interval: Seconds between paho's keepalive/retry housekeeping calls.
+        """
+        self.loop = loop
+        self.mqtt_handler = mqtt_handler
+        self.client = mqtt_handler.client
+        self.misc_interval = float(misc_interval)
+        self.misc_task = None
+        self.closing = False
+
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def connect(self):
+        """Connect to the broker and start the housekeeping task."""
+        self.client.connect(self.mqtt_handler.broker, self.mqtt_handler.port)
+        self.misc_task = self.loop.create_task(self.misc_loop(), name="mqtt-misc")
+
+    def close(self):
+        """Disconnect and stop the housekeeping task."""
+        self.closing = True
+        if self.misc_task:
+            self.misc_task.cancel()
+        self.client.disconnect()
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+
+    # paho calls these on whichever thread publishes, so the selector is only touched from the loop's thread
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.add_writer, sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.remove_writer, sock)
+
+    async def misc_loop(self):
+        """Run paho's periodic housekeeping and reconnect after the connection drops."""
+        while not self.closing:
+            if self.client.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                try:
+                    logging.info("MQTT connection lost, reconnecting...")
+                    self.client.reconnect()
+                except Exception as e:
+                    logging.error(f"MQTT reconnect failed: {e}")
+            await asyncio.sleep(self.misc_interval)
+
+
+class AsyncRuntime:
+    def __init__(self, mqtt_handler, ftp_handler, compare_handler, scheduler, stop_event, executor_workers=8):
+        """
+        Run the server's MQTT I/O, upload checks, comparisons and the experiment plan as coroutines on one event loop.
+        Blocking database and file work goes to a thread pool executor.
+        :param mqtt_handler: MQTTHandler created with start_loop=False.
+        :param ftp_handler: The FtpHandler; its stability checks are scheduled on the loop.
+        :param compare_handler: The Compare handler; comparisons run in the executor.
+        :param scheduler: The experiment Scheduler.
+        :param stop_event: threading.Event that is set when the server should stop.
+        :param executor_workers: Number of threads for blocking work.
+        """
+        self.mqtt_handler = mqtt_handler
+        self.ftp_handler = ftp_handler
+        self.compare_handler = compare_handler
+        self.scheduler = scheduler
+        self.stop_event = stop_event
+        self.executor_workers = int(executor_workers)
+        self.loop = None
+        self.executor = None
+        self.compare_event = None
+        self.stopping = None
+        self.tasks = []
+        self.timings = {}
+
+    def notify_compare(self):
+        """Thread-safe replacement for Compare.notify, wakes the compare coroutine."""
+        self.call_soon(self.compare_event.set)
+
+    def request_stop(self):
+        """Thread-safe request to stop the runtime."""
+        self.stop_event.set()
+        self.call_soon(self.stopping.set)
+
+    def call_soon(self, callback):
+        """Schedule callback on the loop from any thread; ignored once the loop is closed, like during shutdown."""
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # Closed between the check and the call
+            pass
+
+    async def run(self):
+        """Start all coroutines and run until a stop is requested."""
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.executor_workers, thread_name_prefix="AsyncExecutor")
+        self.loop.set_default_executor(self.executor)
+        self.compare_event = asyncio.Event()
+        self.stopping = asyncio.Event()
+
+        bridge = MqttAsyncBridge(self.loop, self.mqtt_handler)
+        bridge.connect()
+        self.ftp_handler.start(run_checker=False)
+
+        self.spawn("ftp-check", self.ftp_check_loop())
+        self.spawn("compare", self.compare_loop())
+        self.spawn("scheduler", self.scheduler_loop())
+        logging.info("Async runtime started.")
+
+        try:
+            await self.stopping.wait()
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            bridge.close()
+            self.executor.shutdown(wait=True)
+            logging.info(f"Async runtime stopped. Timings: {self.stats()}")
+
+    def spawn(self, name, coro):
+        """Start a named task that stops the runtime if it fails."""
+        task = self.loop.create_task(coro, name=name)
+
+        def done(task):
+            if not task.cancelled() and task.exception():
+                logging.error(f"Task {name} failed: {task.exception()}")
+                self.stopping.set()
+        task.add_done_callback(done)
+        self.tasks.append(task)
+        return task
+
+    async def run_blocking(self, name, func, *args):
+        """Run blocking work in the executor and record how long it took."""
+        started = time.monotonic()
+        try:
+            return await self.loop.run_in_executor(None, func, *args)
+        finally:
+            elapsed = time.monotonic() - started
+            timing = self.timings.setdefault(name, {"runs": 0, "seconds": 0.0, "max": 0.0})
+            timing["runs"] += 1
+            timing["seconds"] += elapsed
+            timing["max"] = max(timing["max"], elapsed)
+
+    def stats(self):
+        """Return run counts and durations of the blocking work, per name."""
+        return {name: dict(timing) for name, timing in self.timings.items()}
+
+    async def ftp_check_loop(self):
+        """Check pending uploads for stability every check_interval seconds."""
+        while True:
+            await self.run_blocking("ftp-check", self.ftp_handler.check_pending)
+            await asyncio.sleep(self.ftp_handler.check_interval)
+
+    async def compare_loop(self):
+        """Compare models when results are signalled, debounced, or every interval seconds as a safety net."""
+        compare = self.compare_handler
+        while True:
+            try:
+                await asyncio.wait_for(self.compare_event.wait(), timeout=compare.interval)
+                await self.wait_for_quiet(compare.debounce, compare.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.compare_event.clear()
+            try:
+                await self.run_blocking("compare", compare.find_best_model)
+            except Exception as e:
+                logging.error(f"Error during comparison: {e}")
+
+    async def wait_for_quiet(self, debounce, max_wait):
+        """Wait until no results were signalled for debounce seconds, but no longer than max_wait seconds."""
+        deadline = self.loop.time() + max_wait
+        while debounce > 0:
+            self.compare_event.clear()
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self.compare_event.wait(), timeout=min(debounce, remaining))
+            except asyncio.TimeoutError:
+                return
+
+    async def scheduler_loop(self):
+        """Run the experiment plan and stop the runtime when it is done."""
+        await self.scheduler.run_async()
+        self.request_stop()
@@ -0,0 +1,378 @@
+import os
+import sys
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+import logging
+import paho.mqtt.client as mqtt
+from MqttHandler import MQTTHandler
+from ResultWriter import ResultWriter
+from Dispatcher import CommandDispatcher, parse_lanes
+from FtpMonitor import FtpHandler
+from Compare import Compare
+from Config import Config
+import Codec
+
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakeMqttClient:
+    def __init__(self):
+        """
+        In-process stand-in for paho's client.
+        Published messages are delivered to the matching callbacks from one delivery thread,
+        like paho's network thread, so handlers run the same way they do against a broker.
+        """
+        self.on_connect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+        self.callbacks = []
+        self.subscriptions = []
+        self.queue = queue.Queue()
+        self.thread = None
+        self.mid = 0
+        self.lock = threading.Lock()
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def connect(self, host, port=1883, *args, **kwargs):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def message_callback_add(self, topic_filter, callback):
+        self.callbacks.append((topic_filter, callback))
+
+    def subscribe(self, topics, qos=0):
+        if isinstance(topics, str):
+            topics = [(topics, qos)]
+        self.subscriptions.extend(topic for topic, _ in topics)
+
+    def loop_start(self):
+        self.thread = threading.Thread(target=self.deliver, name="FakeMqttNetwork", daemon=True)
+        self.thread.start()
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+    def loop_stop(self):
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self.lock:
+            self.mid += 1
+        self.queue.put(FakeMessage(topic, payload))
+
+    def deliver(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            if not any(mqtt.topic_matches_sub(sub, message.topic) for sub in self.subscriptions):
+                continue
+            matched = False
+            for topic_filter, callback in self.callbacks:
+                if mqtt.topic_matches_sub(topic_filter, message.topic):
+                    matched = True
+                    callback(self, None, message)
+            if not matched and self.on_message:
+                self.on_message(self, None, message)
+
+
+class FakeSQLHandler:
+    def __init__(self):
+        """In-memory stand-in for SQLHandler that records when each result row was written."""
+        self.lock = threading.Lock()
+        self.users = {}
+        self.models = {}
+        self.latest = {}
+        self.model_files = {}
+        self.written_at = {}
+        self.file_recorded_at = {}
+
+    def InsertUser(self, username):
+        with self.lock:
+            self.users.setdefault(username, len(self.users) + 1)
+
+    def getUser(self, username):
+        with self.lock:
+            userid = self.users.get(username)
+        return (userid,) if userid else None
+
+    def InsertModel(self, filename, rewardMean, rewardStd, username, modelScore):
+        self.InsertModels([(filename, rewardMean, rewardStd, username, modelScore)])
+
+    def InsertModels(self, rows):
+        now = time.perf_counter()
+        with self.lock:
+            for filename, reward_mean, reward_std, username, model_score in rows:
+                self.users.setdefault(username, len(self.users) + 1)
+                model = {"username": username, "filename": filename, "reward_mean": reward_mean,
+                         "reward_std": reward_std, "model_score": model_score}
+                self.models[filename] = model
+                self.latest[username] = model
+                self.written_at[filename] = now
+        return len(rows)
+
+    def RecordModelFile(self, filename, modelHash, size):
+        with self.lock:
+            self.model_files[filename] = modelHash
+            self.file_recorded_at[filename] = time.perf_counter()
+
+    def get_newest_models(self):
+        with self.lock:
+            return [dict(model, model_hash=self.model_files.get(model["filename"])) for model in self.latest.values()]
+
+    def get_all_users_except(self, excluded_username):
+        with self.lock:
+            return [user for user in self.users if user != excluded_username]
+
+    def record_phase_start(self, plan_name, phase_index, phase_name):
+        return None
+
+    def record_phase_end(self, phase_id):
+        pass
+
+    def user_cache_stats(self):
+        return {"size": len(self.users)}
+
+    def close(self):
+        pass
+
+
+def percentile(values, fraction):
+    """Return the value below which the given fraction of values fall."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(name, latencies, elapsed=None, count=None):
+    """Print throughput and latency percentiles in milliseconds."""
+    line = f"{name}: n={len(latencies)}"
+    if elapsed and count is not None:
+        line += f" throughput={count / elapsed:.0f}/s"
+    if latencies:
+        line += f" p50={percentile(latencies, 0.5) * 1000:.2f}ms p99={percentile(latencies, 0.99) * 1000:.2f}ms max={max(latencies) * 1000:.2f}ms"
+    print(line)
+
+
+class Benchmark:
+    def __init__(self, args):
+        """
+        Start the server components against in-process stand-ins.
+        :param args: Parsed command line arguments, see main().
+        """
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="mainserver-bench-")
+        self.watch_dir = os.path.join(self.workdir, "ftp")
+        self.model_dir = os.path.join(self.workdir, "models")
+        self.download_dir = os.path.join(self.workdir, "download")
+        for path in (self.watch_dir, self.model_dir, self.download_dir):
+            os.makedirs(path)
+        env_path = os.path.join(self.workdir, ".env")
+        with open(env_path, "w") as f:
+            f.write("meanWeight=1\nstdWeight=1\nthresholdPercentage=0\n")
+
+        self.config = Config(dotenv_path=env_path)
+        self.db = FakeSQLHandler()
+        self.client = FakeMqttClient()
+        self.writer = ResultWriter(self.db, batch_size=args.batch_size, flush_interval=args.flush_interval)
+        self.dispatcher = CommandDispatcher(lanes=parse_lanes(args.lanes))
+        self.mqtt_handler = MQTTHandler(
+            broker="localhost",
+            port=1883,
+            topics=[("Server/+/Results", 0)],
+            db_handler=self.db,
+            result_writer=self.writer,
+            config=self.config,
+            dispatcher=self.dispatcher,
+            client=self.client
+        )
+        self.ftp = FtpHandler(
+            watch_dir=self.watch_dir,
+            dest_dir=self.model_dir,
+            stability_window=args.stability_window,
+            check_interval=min(0.1, args.stability_window) or 0.1,
+            durability=args.durability,
+            db_handler=self.db
+        )
+        self.compare = Compare(
+            db_handler=self.db,
+            mqtt_handler=self.mqtt_handler,
+            dest_dir=self.download_dir,
+            model_dir=self.model_dir,
+            bestagentname="best.zip",
+            interval=10,
+            threshold_percentage=0,
+            debounce=args.debounce,
+            durability=args.durability,
+            config=self.config
+        )
+        self.promoted_at = {}
+        promote = self.compare.promote
+
+        def timed_promote(modelpath, destPath, model_hash=None):
+            changed = promote(modelpath, destPath, model_hash)
+            if changed:
+                self.promoted_at[os.path.basename(modelpath)] = time.perf_counter()
+            return changed
+        self.compare.promote = timed_promote
+        self.mqtt_handler.add_result_listener(self.compare.notify)
+
+    def start(self):
+        self.writer.start()
+        self.dispatcher.start()
+        self.ftp.start()
+        self.compare_thread = threading.Thread(target=self.compare.run, name="Compare", daemon=True)
+        self.compare_thread.start()
+
+    def stop(self):
+        self.compare.stop()
+        self.ftp.stop()
+        self.mqtt_handler.stop()
+        self.dispatcher.stop()
+        self.writer.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def payload(self, results):
+        return Codec.encode("TestResultat", results=results, fmt=self.args.format)
+
+    def wait_for(self, condition, timeout):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def run_results(self):
+        """Simulate clients publishing TestResultat messages and measure publish to DB row latency."""
+        args = self.args
+        per_message = args.results_per_message if args.format != "legacy" else 1
+        published_at = {}
+        published_lock = threading.Lock()
+        interval = 1.0 / args.rate if args.rate else 0
+
+        def client(index):
+            username = f"user{index}"
+            topic = f"Server/{username}/Results"
+            sent = 0
+            next_send = time.perf_counter()
+            while sent < args.results:
+                count = min(per_message, args.results - sent)
+                results = [(f"{username}_r{sent + i}.zip", float(sent + i), 1.0) for i in range(count)]
+                now = time.perf_counter()
+                with published_lock:
+                    for filename, _, _ in results:
+                        published_at[filename] = now
+                self.client.publish(topic, self.payload(results))
+                sent += count
+                if interval:
+                    next_send += interval * count
+                    time.sleep(max(0.0, next_send - time.perf_counter()))
+
+        total = args.clients * args.results
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(index,)) for index in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        complete = self.wait_for(lambda: len(self.db.written_at) >= total, args.timeout)
+        elapsed = time.perf_counter() - started
+
+        with self.db.lock:
+            latencies = [self.db.written_at[name] - sent for name, sent in published_at.items() if name in self.db.written_at]
+        if not complete:
+            print(f"Timed out: {len(latencies)} of {total} results reached the database.")
+        report("publish -> db row", latencies, elapsed, len(latencies))
+        print(f"result writer: {self.writer.stats()}")
+
+    def run_uploads(self):
+        """
+        Upload model files one at a time, post a better result for each, and measure upload to promotion latency.
+        Runs before run_results, with scores above any simulated result, because those results name files
+        that don't exist and Compare would wait for them if they won.
+        """
+        args = self.args
+        stored = []
+        promoted = []
+        block = os.urandom(min(args.upload_size, 1024 * 1024)) if args.upload_size else b""
+        started = time.perf_counter()
+        for index in range(args.uploads):
+            username = f"uploader{index % args.clients}"
+            file_name = f"{username}_upload{index}.zip"
+            uploaded_at = time.perf_counter()
+            with open(os.path.join(self.watch_dir, file_name), "wb") as f:
+                remaining = args.upload_size
+                f.write(index.to_bytes(8, "big"))
+                while remaining > 0:
+                    f.write(block[:remaining])
+                    remaining -= len(block)
+            if not self.wait_for(lambda: file_name in self.db.file_recorded_at, args.timeout):
+                print(f"Timed out waiting for {file_name} to be stored.")
+                continue
+            stored.append(self.db.file_recorded_at[file_name] - uploaded_at)
+
+            self.client.publish(f"Server/{username}/Results", self.payload([(file_name, 1e9 + index, 0.0)]))
+            if not self.wait_for(lambda: file_name in self.promoted_at, args.timeout):
+                print(f"Timed out waiting for {file_name} to be promoted.")
+                continue
+            promoted.append(self.promoted_at[file_name] - uploaded_at)
+        elapsed = time.perf_counter() - started
+
+        report(f"upload -> stored ({args.upload_size} bytes, stability window {args.stability_window}s)", stored, elapsed, len(stored))
+        report(f"upload -> promoted (debounce {args.debounce}s)", promoted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MainServer against an in-process MQTT client and database.")
+    parser.add_argument("--clients", type=int, default=10, help="Number of simulated clients.")
+    parser.add_argument("--results", type=int, default=1000, help="TestResultat results published per client.")
+    parser.add_argument("--results-per-message", type=int, default=1, help="Results per structured message.")
+    parser.add_argument("--rate", type=float, default=0, help="Results per second per client, 0 for as fast as possible.")
+    parser.add_argument("--format", choices=("legacy", "json", "msgpack"), default="legacy", help="Payload format.")
+    parser.add_argument("--uploads", type=int, default=5, help="Number of model uploads.")
+    parser.add_argument("--upload-size", type=int, default=10 * 1024 * 1024, help="Size of each uploaded model in bytes.")
+    parser.add_argument("--stability-window", type=float, default=0.5, help="FtpMonitor stability window in seconds.")
+    parser.add_argument("--debounce", type=float, default=0.1, help="Compare debounce in seconds.")
+    parser.add_argument("--durability", choices=("none", "file", "full"), default="file", help="fsync policy for stored files.")
+    parser.add_argument("--batch-size", type=int, default=200, help="ResultWriter batch size.")
+    parser.add_argument("--flush-interval", type=float, default=0.5, help="ResultWriter flush interval in seconds.")
+    parser.add_argument("--lanes", default="default:4:1000:block", help="Dispatcher lanes, see Dispatcher.parse_lanes.")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for results and promotions.")
+    parser.add_argument("--log-level", default="WARNING", help="Log level written to stderr.")
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper(), format="%(asctime)s - %(module)s - %(levelname)s - %(message)s")
+
+    benchmark = Benchmark(args)
+    benchmark.start()
+    try:
+        if args.uploads:
+            benchmark.run_uploads()
+        if args.results:
+            benchmark.run_results()
+    finally:
+        benchmark.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import json
+import math
+import logging
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Structured payloads carry a "v" field so the format can evolve without breaking older clients.
+VERSION = 1
+SUPPORTED_VERSIONS = (1,)
+
+# First bytes of a msgpack map or array; legacy payloads are plain text and never start with these.
+_MSGPACK_PREFIXES = set(range(0x80, 0xA0)) | {0xDC, 0xDD, 0xDE, 0xDF}
+
+
+def decode(payload):
+    """
+    Decode an MQTT payload into a list of (command, data) tuples.
+    Accepts the legacy 'command|data' text format, JSON and, if msgpack is installed, msgpack.
+    A structured payload may be one message object or a list of them, and TestResultat messages
+    may carry a "results" list, which is returned as the data.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    if not payload:
+        raise ValueError("Empty message.")
+
+    first = payload[0]
+    if first in (0x7B, 0x5B) or first in _MSGPACK_PREFIXES:  # '{', '[' or msgpack
+        return _decode_structured(_load_structured(payload))
+    return [decode_legacy(payload.decode("utf-8"))]
+
+
+def _load_structured(payload):
+    """Parse JSON or msgpack bytes into Python objects."""
+    if payload[0] in (0x7B, 0x5B):
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON message: {e}")
+    if msgpack is None:
+        raise ValueError("Received a msgpack message, but msgpack is not installed.")
+    try:
+        return msgpack.unpackb(payload, raw=False)
+    except Exception as e:
+        raise ValueError(f"Invalid msgpack message: {e}")
+
+
+def decode_data(payload):
+    """
+    Decode the payload of a topic that carries a single command, so it holds only that command's data.
+    Structured payloads return their "results" list (or "data" value); anything else is returned as text.
+    """
+    if isinstance(payload, str):
+        return payload
+    if payload[:1] in (b"{", b"[") or (payload and payload[0] in _MSGPACK_PREFIXES):
+        body = _load_structured(payload)
+        if isinstance(body, list):
+            return body
+        if not isinstance(body, dict):
+            raise ValueError("Invalid structured message. Expected an object or a list.")
+        version = body.get("v", VERSION)
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported message version {version}.")
+        if "results" in body:
+            if not isinstance(body["results"], list):
+                raise ValueError("Invalid structured message. 'results' must be a list.")
+            return body["results"]
+        return body.get("data", "")
+    return payload.decode("utf-8")
+
+
+def decode_legacy(message):
+    """Parse a legacy 'command|data' message into command and data."""
+    try:
+        command, data = message.split("|", 1)
+        return command, data
+    except ValueError:
+        raise ValueError("Invalid message format. Expected 'command|data...'.")
+
+
+def _decode_structured(body):
+    """Turn a decoded JSON/msgpack body into (command, data) tuples."""
+    messages = body if isinstance(body, list) else [body]
+    decoded = []
+    for message in messages:
+        if not isinstance(message, dict):
+            raise ValueError("Invalid structured message. Expected an object.")
+        version = message.get("v", VERSION)
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported message version {version}.")
+        command = message.get("cmd")
+        if not command:
+            raise ValueError("Invalid structured message. Missing 'cmd'.")
+        if not isinstance(command, str):
+            raise ValueError("Invalid structured message. 'cmd' must be a string.")
+        if "results" in message:
+            if not isinstance(message["results"], list):
+                raise ValueError("Invalid structured message. 'results' must be a list.")
+            decoded.append((command, message["results"]))
+        else:
+            decoded.append((command, message.get("data", "")))
+    return decoded
+
+
+def parse_results(data):
+    """
+    Normalize TestResultat data into a list of (FileName, rewardMean, rewardStd) tuples.
+    :param data: Either the legacy 'FileName|rewardMean|rewardStd' string, or a list of entries
+                 that are {"file", "mean", "std"} objects or [file, mean, std] lists.
+    """
+    if isinstance(data, str):
+        try:
+            FileName, rewardMean, rewardStd = data.split("|", 2)
+            return [_result(FileName, rewardMean, rewardStd)]
+        except ValueError:
+            raise ValueError("Invalid message format. Expected 'data|data|data..'.")
+
+    results = []
+    for entry in data:
+        try:
+            if isinstance(entry, dict):
+                results.append(_result(entry["file"], entry["mean"], entry["std"]))
+            else:
+                FileName, rewardMean, rewardStd = entry
+                results.append(_result(FileName, rewardMean, rewardStd))
+        except (KeyError, TypeError, ValueError):
+            logging.error(f"Skipping invalid result entry: {entry}")
+    return results
+
+
+def _result(FileName, rewardMean, rewardStd):
+    """Build one result tuple; NaN and infinite rewards are rejected since MySQL cannot store them."""
+    rewardMean, rewardStd = float(rewardMean), float(rewardStd)
+    if not (math.isfinite(rewardMean) and math.isfinite(rewardStd)):
+        raise ValueError(f"Non-finite reward for '{FileName}'.")
+    return str(FileName), rewardMean, rewardStd
+
+
+def encode(command, data="", results=None, fmt="json"):
+    """
+    Encode a message for publishing.
+    :param command: The command name.
+    :param data: Data for commands without results.
+    :param results: Optional list of (FileName, rewardMean, rewardStd) tuples.
+    :param fmt: "json", "msgpack" or "legacy". The legacy format holds at most one result.
+    """
+    if fmt == "legacy":
+        if results:
+            if len(results) != 1:
+                raise ValueError("The legacy format carries exactly one result per message.")
+            data = "|".join(str(value) for value in results[0])
+        return f"{command}|{data}".encode("utf-8")
+
+    body = {"v": VERSION, "cmd": command}
+    if results is not None:
+        body["results"] = [list(result) for result in results]
+    else:
+        body["data"] = data
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack is not installed.")
+        return msgpack.packb(body, use_bin_type=True)
+    if fmt == "json":
+        return json.dumps(body, separators=(",", ":")).encode("utf-8")
+    raise ValueError(f"Unknown format '{fmt}'.")
@@ -1,39 +1,78 @@
 import time
 import os
-import shutil
+import threading
 import logging
+from FileUtils import publish_file
+import Metrics
 
 class Compare:
-    def __init__(self, db_handler,mqtt_handler, dest_dir, model_dir,bestagentname, interval=10, threshold_percentage=5):
+    def __init__(self, db_handler,mqtt_handler, dest_dir, model_dir,bestagentname, interval=10, threshold_percentage=5, debounce=1, durability="file", config=None, notify_mode="per_user", broadcast_topic="all/Commands", legacy_clients=None, tiered_store=None):
         """
         Initialize the Compare handler.
         :param db_handler: The database handler class.
         :param mqtt_handler: the mqtt handler class.
-        :param interval: Time in seconds to wait between comparisons.
+        :param interval: Time in seconds between safety-net comparisons when no new results are signalled.
         :param threshold_percentage: the percentage the new model needs to be better then the old.
+        :param debounce: Seconds without new results to wait for before comparing, so bursts are evaluated once.
+        :param durability: fsync policy for the promoted file, one of "none", "file" or "full".
+        :param config: Optional shared Config; thresholdPercentage is re-read from it on every comparison.
+        :param notify_mode: "per_user" publishes NewModel to every other user's topic, "broadcast" publishes once to broadcast_topic.
+        :param broadcast_topic: Shared topic all clients listen on.
+        :param legacy_clients: Usernames that don't understand the broadcast and still get a per-user publish in broadcast mode.
+        :param tiered_store: Optional TieredStore archived models are fetched back from before they are promoted.
         :param dest_dir: The directory the models gets copied to.
         :param model_dir: the directory the models gets copied from.
         """
         self.db_handler = db_handler
         self.mqtt_handler = mqtt_handler
         self.interval = int(interval)
+        self.debounce = float(debounce)
+        self.wakeup = threading.Event()
         self.running = True
         self.bestmodel = None
         self.threshold_percentage = float(threshold_percentage)
         self.dest_dir=dest_dir
         self.model_dir=model_dir
         self.Bestagentname=bestagentname
+        self.durability=durability
+        self.config=config
+        if notify_mode not in ("per_user", "broadcast"):
+            raise ValueError(f"Unknown notify mode '{notify_mode}'.")
+        self.notify_mode=notify_mode
+        self.broadcast_topic=broadcast_topic
+        self.legacy_clients=list(legacy_clients) if legacy_clients else []
+        self.tiered_store=tiered_store
+        self.promoted_signature=None
+        self.promoted_hash=None
 
 
+    def notify(self):
+        """Signal that new results have been stored and the models should be compared again."""
+        self.wakeup.set()
+
     def run(self):
-        """Main loop for comparing models."""
+        """Main loop for comparing models, woken by notify() or after interval seconds."""
         while self.running:
+            if self.wakeup.wait(self.interval):
+                self.wait_for_quiet()
+            self.wakeup.clear()
+            if not self.running:
+                break
             try:
                 self.find_best_model()
             except Exception as e:
-                logging(f"Error during comparison: {e}")
-            time.sleep(self.interval)
+                logging.error(f"Error during comparison: {e}")
+
+    def wait_for_quiet(self):
+        """Wait until no new results arrived for debounce seconds, but no longer than interval seconds."""
+        deadline = time.monotonic() + self.interval
+        while self.running and self.debounce > 0:
+            self.wakeup.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.wakeup.wait(min(self.debounce, remaining)):
+                return
 
+    @Metrics.timed(Metrics.COMPARE_SECONDS)
     def find_best_model(self):
         """Fetch and identify the best model."""
         models = self.db_handler.get_newest_models()
@@ -43,15 +82,14 @@ class Compare:
         if len(models) < 2:
             logging.info("Not enough models to compare. so just uses newest model")
             Newestmodel = models[0]
-            modelpath = os.path.join(self.model_dir, Newestmodel['username'], Newestmodel['filename'])
+            modelpath = self.local_model_path(Newestmodel)
             logging.info(f"model from {modelpath}")
             destPath = os.path.join(self.dest_dir,self.Bestagentname)
             logging.info(f"will be copied to {destPath}")
             if not os.path.isfile(modelpath):
                 time.sleep(20)
             if os.path.isfile(modelpath):
-                shutil.copy(modelpath, destPath)
-                logging.info("file has been copied")
+                self.promote(modelpath, destPath, Newestmodel.get('model_hash'))
                 return
             else:
                 logging.info("File is still not available after waiting.")
@@ -61,6 +99,9 @@ class Compare:
 
         logging.info("Determining the best model...")
 
+        if self.config:
+            self.threshold_percentage = float(self.config.get("thresholdPercentage", self.threshold_percentage))
+
 
         best_model = max(models, key=lambda m: m["model_score"])
         if best_model != self.bestmodel:
@@ -68,20 +109,15 @@ class Compare:
                 # Display the new best model
                 logging.info(f"Best Model: {best_model['username']} - {best_model}")
                 try:
-                    modelpath = os.path.join(self.model_dir, best_model['username'], best_model['filename'])
+                    modelpath = self.local_model_path(best_model)
                     logging.info(f"model from {modelpath}")
                     destPath = os.path.join(self.dest_dir,self.Bestagentname)
                     logging.info(f"will be copied to {destPath}")
                     if not os.path.isfile(modelpath):
                         time.sleep(20)
                     if os.path.isfile(modelpath):
-                        shutil.copy(modelpath,destPath)
-                        logging.info("file has been copied")
-                        usernames = self.db_handler.get_all_users_except(best_model['username'])
-                        for user in usernames:
-                            payload=f"NewModel|{self.Bestagentname}"
-                            topic=f"{user}/Commands"
-                            self.mqtt_handler.send_message(topic,payload)
+                        if self.promote(modelpath, destPath, best_model.get('model_hash')):
+                            self.announce(best_model['username'])
                         self.bestmodel = best_model
                         return
                     else:
@@ -98,6 +134,59 @@ class Compare:
             logging.info("It is the same best model as before.")
                    
 
+    def reset_best(self):
+        """Forget the current best model, so the next comparison ranks from scratch, e.g. after a rescore."""
+        self.bestmodel = None
+        self.notify()
+
+    def local_model_path(self, model):
+        """Return the local path of a model, fetching it back from the archive if it was evicted."""
+        modelpath = os.path.join(self.model_dir, model['username'], model['filename'])
+        if self.tiered_store and not os.path.isfile(modelpath):
+            self.tiered_store.fetch(model['username'], model['filename'], model.get('model_hash'))
+        return modelpath
+
+    def promote(self, modelpath, destPath, model_hash=None):
+        """
+        Atomically publish modelpath as the best model file.
+        Skips the publish when destPath already holds this exact file, judged by content hash when known.
+        :param model_hash: SHA-256 of the model recorded by the model store, if any.
+        :return: True if destPath changed, False if it was already up to date.
+        """
+        stat = os.stat(modelpath)
+        signature = (modelpath, stat.st_size, stat.st_mtime_ns)
+        if os.path.isfile(destPath):
+            same_hash = model_hash is not None and model_hash == self.promoted_hash
+            if same_hash or signature == self.promoted_signature or os.path.samefile(modelpath, destPath):
+                self.promoted_signature = signature
+                self.promoted_hash = model_hash or self.promoted_hash
+                logging.info("Best model file is already up to date, skipping copy.")
+                return False
+        linked = publish_file(modelpath, destPath, self.durability)
+        self.promoted_signature = signature
+        self.promoted_hash = model_hash
+        Metrics.COMPARE_PROMOTIONS.inc()
+        logging.info("file has been linked" if linked else "file has been copied")
+        return True
+
+    def announce(self, winner):
+        """
+        Tell the clients that a new best model is available.
+        In broadcast mode a single message goes to broadcast_topic, with the winning user as an extra
+        field so that client can ignore it, and no user lookup is needed.
+        :param winner: Username of the user whose model was promoted.
+        """
+        payload=f"NewModel|{self.Bestagentname}"
+        if self.notify_mode == "broadcast":
+            self.mqtt_handler.send_message(self.broadcast_topic, f"{payload}|{winner}")
+            usernames = [user for user in self.legacy_clients if user != winner]
+        else:
+            usernames = self.db_handler.get_all_users_except(winner)
+        for user in usernames:
+            topic=f"{user}/Commands"
+            self.mqtt_handler.send_message(topic,payload)
+
     def stop(self):
         """Stop the comparison loop."""
         self.running = False
+        self.wakeup.set()
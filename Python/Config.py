@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+import types
+import dotenv
+import logging
+
+class Config:
+    def __init__(self, dotenv_path=None, check_interval=1.0):
+        """
+        Initialize the shared configuration.
+        Values come from the environment, overridden by the .env file, and the file is only
+        re-read when its mtime changes.
+        :param dotenv_path: Path to the .env file, found with dotenv.find_dotenv() when None.
+        :param check_interval: Minimum seconds between mtime checks of the .env file.
+        """
+        self.path = dotenv_path if dotenv_path is not None else dotenv.find_dotenv()
+        self.check_interval = float(check_interval)
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.last_check = 0.0
+        self.values = types.MappingProxyType({})
+        self.listeners = []
+        self.reload(force=True)
+
+    def reload(self, force=False):
+        """
+        Re-read the .env file if it changed since the last read.
+        :param force: Re-read even if the mtime is unchanged.
+        :return: True if the configuration was reloaded.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns if self.path else None
+        except FileNotFoundError:
+            mtime = None
+
+        with self.lock:
+            if not force and mtime == self.mtime:
+                return False
+            values = dict(os.environ)
+            if mtime is not None:
+                values.update({key: value for key, value in dotenv.dotenv_values(self.path).items() if value is not None})
+            old_values = self.values
+            self.values = types.MappingProxyType(values)
+            self.mtime = mtime
+
+        if not force:
+            logging.info(f"Configuration reloaded from {self.path}")
+        for callback in self.listeners:
+            try:
+                callback(old_values, self.values)
+            except Exception as e:
+                logging.error(f"Config listener failed: {e}")
+        return True
+
+    def snapshot(self):
+        """
+        Return a read-only, consistent view of all values.
+        Checks the .env file for changes at most every check_interval seconds.
+        """
+        now = time.monotonic()
+        if now - self.last_check >= self.check_interval:
+            self.last_check = now
+            self.reload()
+        return self.values
+
+    def get(self, key, default=None):
+        """Return a single value from the current snapshot."""
+        return self.snapshot().get(key, default)
+
+    def add_listener(self, callback):
+        """Register a callback(old_values, new_values) that is called after every reload."""
+        self.listeners.append(callback)
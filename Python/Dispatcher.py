@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+import zlib
+import logging
+
+_STOP = object()
+
+POLICIES = ("block", "reject", "drop_oldest")
+
+
+def parse_lanes(spec):
+    """
+    Parse a lane spec like "default:4:1000:block,fast:1:100:drop_oldest".
+    Each entry is name:workers:queue_size:policy, where queue_size is per worker.
+    """
+    lanes = {}
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        name, workers, queue_size, policy = [part.strip() for part in entry.split(":")]
+        lanes[name] = {"workers": int(workers), "queue_size": int(queue_size), "policy": policy}
+    return lanes
+
+
+def parse_routes(spec):
+    """Parse a route spec like "LoopStarted:fast,LoopStopped:fast" into a command to lane map."""
+    routes = {}
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        command, lane = [part.strip() for part in entry.split(":")]
+        routes[command] = lane
+    return routes
+
+
+class Lane:
+    def __init__(self, name, workers=4, queue_size=1000, policy="block", block_timeout=5):
+        """
+        Initialize a lane of worker threads.
+        Every worker has its own bounded queue, and a username always maps to the same worker,
+        so commands from one user run in the order they arrived.
+        :param name: Name of the lane, used in logs and stats.
+        :param workers: Number of worker threads.
+        :param queue_size: Maximum number of waiting commands per worker.
+        :param policy: What to do when a worker queue is full: "block", "reject" or "drop_oldest".
+        :param block_timeout: Seconds the "block" policy waits before rejecting the command.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}' for lane '{name}'.")
+        self.name = name
+        self.policy = policy
+        self.block_timeout = float(block_timeout)
+        self.queues = [queue.Queue(maxsize=int(queue_size)) for _ in range(max(1, int(workers)))]
+        self.threads = []
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "processed": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "errors": 0,
+            "handler_seconds": 0.0,
+        }
+
+    def start(self):
+        """Start the worker threads."""
+        for index, work_queue in enumerate(self.queues):
+            thread = threading.Thread(target=self.work, args=(work_queue,), name=f"Dispatch-{self.name}-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """Stop the workers after they finish the commands already queued."""
+        for work_queue in self.queues:
+            work_queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def submit(self, key, handler, args):
+        """
+        Queue a call of handler(*args) on the worker owning key.
+        :return: True if the command was queued.
+        """
+        work_queue = self.queues[zlib.crc32(str(key).encode("utf-8")) % len(self.queues)]
+        item = (handler, args)
+        try:
+            if self.policy == "block":
+                work_queue.put(item, timeout=self.block_timeout)
+            elif self.policy == "reject":
+                work_queue.put_nowait(item)
+            else:
+                while True:
+                    try:
+                        work_queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        try:
+                            work_queue.get_nowait()
+                            self._count("dropped")
+                        except queue.Empty:
+                            pass
+        except queue.Full:
+            self._count("rejected")
+            logging.error(f"Dispatch lane '{self.name}' is full, rejected command for '{key}'.")
+            return False
+        self._count("submitted")
+        return True
+
+    def work(self, work_queue):
+        """Run queued commands until stopped."""
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                break
+            handler, args = item
+            started = time.monotonic()
+            try:
+                handler(*args)
+            except Exception as e:
+                self._count("errors")
+                logging.error(f"Error in dispatch lane '{self.name}': {e}")
+            self._count("processed")
+            self._count("handler_seconds", time.monotonic() - started)
+
+    def stats(self):
+        """Return a snapshot of the lane counters and queue depth."""
+        with self.stats_lock:
+            stats = dict(self.counters)
+        stats["queue_depth"] = sum(work_queue.qsize() for work_queue in self.queues)
+        return stats
+
+    def _count(self, name, amount=1):
+        with self.stats_lock:
+            self.counters[name] += amount
+
+
+class CommandDispatcher:
+    def __init__(self, lanes=None, routes=None, default_lane="default"):
+        """
+        Initialize the command dispatcher.
+        Commands that depend on each other for the same user (like NewUser and TestResultat)
+        should share a lane, since ordering is only guaranteed within a lane.
+        :param lanes: Dict of lane name to Lane keyword arguments (workers, queue_size, policy).
+        :param routes: Dict of command to lane name; unrouted commands use default_lane.
+        :param default_lane: The lane for commands without a route.
+        """
+        lanes = dict(lanes) if lanes else {}
+        lanes.setdefault(default_lane, {})
+        self.lanes = {name: Lane(name, **options) for name, options in lanes.items()}
+        self.routes = dict(routes) if routes else {}
+        self.default_lane = default_lane
+        for command, lane in self.routes.items():
+            if lane not in self.lanes:
+                raise ValueError(f"Command '{command}' is routed to unknown lane '{lane}'.")
+
+    def start(self):
+        """Start all lanes."""
+        for lane in self.lanes.values():
+            lane.start()
+        logging.info(f"CommandDispatcher started with lanes: {', '.join(self.lanes)}")
+
+    def stop(self):
+        """Stop all lanes, finishing queued commands first."""
+        for lane in self.lanes.values():
+            lane.stop()
+        logging.info("CommandDispatcher stopped.")
+
+    def submit(self, command, username, handler, *args):
+        """
+        Run handler(*args) on the lane routed for command, ordered per username.
+        :return: True if the command was queued.
+        """
+        lane = self.lanes[self.routes.get(command, self.default_lane)]
+        return lane.submit(username, handler, args)
+
+    def stats(self):
+        """Return the counters of every lane."""
+        return {name: lane.stats() for name, lane in self.lanes.items()}
@@ -0,0 +1,131 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+# Durability policies for published files:
+#   "none" - rely on the OS to flush data eventually.
+#   "file" - fsync the file contents before it becomes visible under its final name.
+#   "full" - like "file", and also fsync the directory so the rename itself survives a crash.
+DURABILITY_POLICIES = ("none", "file", "full")
+
+COPY_CHUNK = 64 * 1024 * 1024
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def same_device(src_path, dest_dir):
+    """Return True if src_path and dest_dir live on the same filesystem."""
+    return os.stat(src_path).st_dev == os.stat(dest_dir).st_dev
+
+
+def fsync_file(path):
+    """Flush a file's contents to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path):
+    """Flush a directory entry to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def copy_fd(src_fd, dst_fd, size):
+    """
+    Copy size bytes between file descriptors inside the kernel where possible.
+    Tries copy_file_range, then sendfile, then falls back to a userspace copy.
+    """
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                sent = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - copied))
+                if sent == 0:
+                    break
+                copied += sent
+            return copied
+        except OSError:
+            # Not supported between these filesystems, continue where it stopped
+            pass
+    if hasattr(os, "sendfile"):
+        try:
+            while copied < size:
+                sent = os.sendfile(dst_fd, src_fd, copied, min(COPY_CHUNK, size - copied))
+                if sent == 0:
+                    break
+                copied += sent
+            return copied
+        except OSError:
+            pass
+    os.lseek(src_fd, copied, os.SEEK_SET)
+    os.lseek(dst_fd, copied, os.SEEK_SET)
+    with os.fdopen(os.dup(src_fd), "rb") as src, os.fdopen(os.dup(dst_fd), "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK)
+    return size
+
+
+def copy_to_temp(src_path, dest_dir, durability="file"):
+    """
+    Copy a file into a hidden temp file in dest_dir and return the temp path.
+    The caller publishes it with os.replace, which is atomic within dest_dir.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".", suffix=".tmp")
+    try:
+        with open(src_path, "rb") as src:
+            stat = os.fstat(src.fileno())
+            os.fchmod(fd, stat.st_mode & 0o7777)
+            copy_fd(src.fileno(), fd, stat.st_size)
+        if durability != "none":
+            os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        os.remove(tmp_path)
+        raise
+    os.close(fd)
+    return tmp_path
+
+
+def publish_file(src_path, dest_path, durability="file"):
+    """
+    Atomically replace dest_path with the contents of src_path, leaving src_path in place.
+    Hardlinks the source when both paths share a filesystem, otherwise copies into a temp file first,
+    so readers of dest_path see either the old or the new file, never a partial one.
+    :param durability: One of DURABILITY_POLICIES.
+    :return: True if the file was hardlinked, False if it was copied.
+    """
+    if durability not in DURABILITY_POLICIES:
+        raise ValueError(f"Unknown durability policy '{durability}'.")
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+
+    linked = False
+    if same_device(src_path, dest_dir):
+        tmp_path = os.path.join(dest_dir, f".{os.path.basename(dest_path)}.{os.getpid()}.link")
+        try:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            os.link(src_path, tmp_path)
+            linked = True
+        except OSError:
+            # Filesystems without hardlink support fall back to a copy
+            linked = False
+    if not linked:
+        tmp_path = copy_to_temp(src_path, dest_dir, durability)
+    os.replace(tmp_path, dest_path)
+
+    if durability == "full":
+        fsync_dir(dest_dir)
+    return linked
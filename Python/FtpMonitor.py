@@ -1,72 +1,171 @@
 import os
-import shutil
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import logging
+from ModelStore import ModelStore
+import Metrics
 
 class FtpHandler:
-    def __init__(self, watch_dir, dest_dir, mqtt_handler=None, topic=None):
+    def __init__(self, watch_dir, dest_dir, mqtt_handler=None, topic=None, stability_window=5, check_interval=1, workers=4, durability="file", db_handler=None, tiered_store=None):
         """
         Initialize the FTP handler.
         :param watch_dir: Directory to monitor.
         :param dest_dir: Directory to copy files to.
         :param mqtt_handler: Instance of MQTTHandler to send messages.
         :param topic: MQTT topic to publish messages to.
+        :param stability_window: Seconds a file's size and mtime must stay unchanged before it is processed.
+        :param check_interval: Seconds between checks of the pending uploads.
+        :param workers: Number of worker threads processing finished uploads.
+        :param durability: fsync policy for moved files, one of "none", "file" or "full".
+        :param db_handler: Optional database handler the hash of each stored model is recorded with.
+        :param tiered_store: Optional TieredStore that is told about every stored model, for its LRU order.
         """
         self.watch_dir = watch_dir
         self.dest_dir = dest_dir
         self.mqtt_handler = mqtt_handler
         self.topic = topic
+        self.stability_window = float(stability_window)
+        self.check_interval = float(check_interval)
+        self.workers = int(workers)
+        self.durability = durability
+        self.db_handler = db_handler
+        self.tiered_store = tiered_store
+        # Share the tiered store's ModelStore, whose lock keeps eviction away from blobs being ingested
+        self.model_store = tiered_store.model_store if tiered_store else ModelStore(dest_dir, durability)
         self.observer = Observer()
+        self.pending = {}
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.running = False
+        self.checker = None
+        self.executor = None
 
-    def start(self):
-        """Start monitoring the directory."""
-        event_handler = UploadEventHandler(self.dest_dir, self.mqtt_handler, self.topic)
+    def start(self, run_checker=True):
+        """
+        Start monitoring the directory.
+        :param run_checker: Start a thread that calls check_pending periodically. The asyncio runtime
+                            passes False and schedules check_pending itself.
+        """
+        self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="FtpWorker")
+        if run_checker:
+            self.checker = threading.Thread(target=self.check_loop, name="FtpStabilityChecker", daemon=True)
+            self.checker.start()
+        event_handler = UploadEventHandler(self)
         self.observer.schedule(event_handler, self.watch_dir, recursive=False)
         self.observer.start()
         logging.info(f"FtpHandler started. Watching directory: {self.watch_dir}")
 
     def stop(self):
-        """Stop monitoring the directory."""
+        """Stop monitoring the directory. Does nothing if the handler was never started or is already stopped."""
+        if not self.running:
+            return
         self.observer.stop()
         self.observer.join()
+        self.running = False
+        if self.checker:
+            self.checker.join()
+        if self.executor:
+            self.executor.shutdown(wait=True)
         logging.info("FtpHandler stopped.")
 
+    def track(self, src_path):
+        """Add a new upload to the pending set until it is stable."""
+        with self.lock:
+            if src_path in self.pending or src_path in self.in_flight:
+                return
+            self.pending[src_path] = (None, None, time.monotonic())
+        logging.info(f"Tracking upload: {src_path}")
+
+    def mark_closed(self, src_path):
+        """
+        Hand an upload to the workers right away once the writer has closed it.
+        Paths that are no longer pending were already submitted by the stability checker and are ignored.
+        """
+        with self.lock:
+            if self.pending.pop(src_path, None) is None:
+                return
+            self.in_flight.add(src_path)
+        self.submit(src_path)
+
+    def check_loop(self):
+        """Periodically move stable uploads from the pending set to the workers."""
+        while self.running:
+            self.check_pending()
+            time.sleep(self.check_interval)
+
+    def check_pending(self):
+        """Submit every pending upload whose size and mtime have not changed for stability_window seconds."""
+        now = time.monotonic()
+        ready = []
+        with self.lock:
+            for src_path, (size, mtime, stable_since) in list(self.pending.items()):
+                try:
+                    stat = os.stat(src_path)
+                except FileNotFoundError:
+                    logging.info(f"Upload disappeared before it was stable: {src_path}")
+                    del self.pending[src_path]
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                    self.pending[src_path] = (stat.st_size, stat.st_mtime_ns, now)
+                elif now - stable_since >= self.stability_window:
+                    # Leaves pending and enters in_flight under one lock, so a late close event cannot submit it again
+                    del self.pending[src_path]
+                    self.in_flight.add(src_path)
+                    ready.append(src_path)
+        for src_path in ready:
+            self.submit(src_path)
+
+    def submit(self, src_path):
+        """Queue an upload, already moved from pending to in_flight, for processing by the worker pool."""
+        self.executor.submit(self.process_upload, src_path)
+
+    def process_upload(self, src_path):
+        """Move a finished upload into the model store, linked under the user's directory."""
+        file_name = os.path.basename(src_path)
+        try:
+
+            username = file_name.split('_')[0]
+
+            digest, size, deduplicated = self.model_store.ingest(src_path, username, file_name)
+            dest_path = self.model_store.user_path(username, file_name)
+            if deduplicated:
+                logging.info(f"File {src_path} linked to existing blob as {dest_path} ({size} bytes)")
+                Metrics.FTP_FILES.inc(result="deduplicated")
+            else:
+                logging.info(f"File moved from {src_path} to {dest_path} ({size} bytes, sha256 {digest})")
+                Metrics.FTP_FILES.inc(result="stored")
+                Metrics.FTP_BYTES.inc(size)
+            if self.db_handler:
+                self.db_handler.RecordModelFile(file_name, digest, size)
+            if self.tiered_store:
+                self.tiered_store.touch(digest)
+
+        except Exception as e:
+            Metrics.FTP_FILES.inc(result="failed")
+            logging.error(f"Failed to process file {src_path}: {e}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(src_path)
+
 
 class UploadEventHandler(FileSystemEventHandler):
-    def __init__(self, dest_dir, mqtt_handler=None, topic=None):
+    def __init__(self, ftp_handler):
         """
         Initialize the event handler.
-        :param dest_dir: Directory to copy files to.
-        :param mqtt_handler: Instance of MQTTHandler to send messages.
-        :param topic: MQTT topic to publish messages to.
+        :param ftp_handler: The FtpHandler tracking and processing the uploads.
         """
-        self.dest_dir = dest_dir
-        self.mqtt_handler = mqtt_handler
-        self.topic = topic
+        self.ftp_handler = ftp_handler
 
     def on_created(self, event):
         """Handle file creation events."""
         if not event.is_directory:
-            src_path = event.src_path
-            file_name = os.path.basename(src_path)
-
-            try:
-
-                username = file_name.split('_')[0]
-
-                user_dir = os.path.join(self.dest_dir, username)
-                if not os.path.exists(user_dir):
-                    os.makedirs(user_dir)
-                    logging.info(f"Directory created: {user_dir}")
-                time.sleep(20)
-                dest_path = os.path.join(user_dir, file_name)
-                shutil.copy(src_path, dest_path)
-                logging.info(f"File copied from {src_path} to {dest_path}")
-
-                os.remove(src_path)
-                logging.info(f"File deleted from source: {src_path}")
-        
-            except Exception as e:
-                logging.error(f"Failed to process file {src_path}: {e}")
+            self.ftp_handler.track(event.src_path)
+
+    def on_closed(self, event):
+        """Handle file closed after writing events (IN_CLOSE_WRITE, where the observer supports it)."""
+        if not event.is_directory:
+            self.ftp_handler.mark_closed(event.src_path)
@@ -1,37 +1,354 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from hdfs import InsecureClient
+import requests
+from requests.adapters import HTTPAdapter
+
+CHECKSUM_SUFFIX = ".sha256"
+PART_SUFFIX = ".part"
+
+
+class TransferProgress:
+    def __init__(self, name: str, total_bytes: int, interval: float = 5, callback=None):
+        """
+        Track the bytes moved by a transfer and log progress and throughput.
+        :param name: Description of the transfer used in the logs.
+        :param total_bytes: Bytes the transfer will move in total.
+        :param interval: Minimum seconds between progress logs.
+        :param callback: Optional callable(done_bytes, total_bytes, bytes_per_second) called with every update.
+        """
+        self.name = name
+        self.total_bytes = total_bytes
+        self.interval = float(interval)
+        self.callback = callback
+        self.done_bytes = 0
+        self.started = time.monotonic()
+        self.last_log = self.started
+        self.lock = threading.Lock()
+
+    def add(self, amount: int):
+        """Record amount more bytes as transferred."""
+        with self.lock:
+            self.done_bytes += amount
+            done = self.done_bytes
+            now = time.monotonic()
+            log = now - self.last_log >= self.interval
+            if log:
+                self.last_log = now
+        rate = done / max(now - self.started, 1e-9)
+        if log:
+            logging.info(f"{self.name}: {done}/{self.total_bytes} bytes ({rate / 1024 / 1024:.1f} MiB/s)")
+        if self.callback:
+            self.callback(done, self.total_bytes, rate)
+
+    def finish(self):
+        """Log the final throughput of the transfer."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        logging.info(f"{self.name}: {self.done_bytes} bytes in {elapsed:.1f}s ({self.done_bytes / elapsed / 1024 / 1024:.1f} MiB/s)")
+
 
 class HDFSHandler:
-    def __init__(self, hdfs_url: str, user: str):
+    def __init__(self, hdfs_url: str, user: str, streams: int = 4, chunk_size: int = 8 * 1024 * 1024, retries: int = 3, progress_interval: float = 5, client=None):
         """
         Initialize the HDFS handler.
+        All transfers share one HTTP session whose connection pool holds a connection per stream.
         :param hdfs_url: The URL of the HDFS cluster (e.g., "http://namenode_host:50070").
         :param user: The HDFS user.
+        :param streams: Number of parallel transfers, files for directories and ranges for large downloads.
+        :param chunk_size: Bytes per append request on upload and per ranged read on download.
+        :param retries: Attempts per chunk before a transfer fails; every retry resumes from the last good offset.
+        :param progress_interval: Minimum seconds between progress logs.
+        :param client: Optional WebHDFS client to use instead of creating an InsecureClient, like a local stand-in.
         """
-        self.client = InsecureClient(hdfs_url, user=user)
+        self.streams = max(1, int(streams))
+        self.chunk_size = int(chunk_size)
+        self.retries = max(1, int(retries))
+        self.progress_interval = float(progress_interval)
+        self.stop_requested = False
+        if client is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.streams, pool_maxsize=self.streams)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            client = InsecureClient(hdfs_url, user=user, session=session)
+        self.client = client
 
-    def upload_file(self, local_path: str, hdfs_path: str):
+    def upload_file(self, local_path: str, hdfs_path: str, overwrite: bool = True, progress=None) -> bool:
         """
         Upload a file to HDFS.
+        The file is appended chunk by chunk to hdfs_path.part, so an interrupted upload continues from the
+        length already on HDFS once the bytes there are checked against the local file. Its SHA-256 is
+        written to hdfs_path.sha256 before the part file is renamed.
         :param local_path: The local file path.
         :param hdfs_path: The target path on HDFS.
+        :param overwrite: Replace an existing file at hdfs_path.
+        :param progress: Optional TransferProgress shared with other transfers.
+        :return: True if the file was uploaded.
         """
+        size = os.path.getsize(local_path)
+        own_progress = progress is None
+        if own_progress:
+            progress = TransferProgress(f"Upload {local_path}", size, self.progress_interval)
+        part_path = hdfs_path + PART_SUFFIX
         try:
-            self.client.upload(hdfs_path, local_path)
-            print(f"Successfully uploaded {local_path} to {hdfs_path}")
+            if not overwrite and self.client.status(hdfs_path, strict=False) is not None:
+                logging.info(f"{hdfs_path} already exists, skipping upload of {local_path}")
+                return False
+
+            digest = self._append_from(local_path, part_path, size, progress)
+            status = self.client.status(part_path)
+            if status["length"] != size:
+                raise IOError(f"Uploaded {status['length']} bytes of {part_path}, expected {size}.")
+
+            self.client.write(hdfs_path + CHECKSUM_SUFFIX, data=digest, overwrite=True, encoding="utf-8")
+            if self.client.status(hdfs_path, strict=False) is not None:
+                self.client.delete(hdfs_path)
+            self.client.rename(part_path, hdfs_path)
+            logging.info(f"Successfully uploaded {local_path} to {hdfs_path} (sha256 {digest})")
+            return True
         except Exception as e:
-            print(f"Error uploading file: {e}")
+            logging.error(f"Error uploading {local_path} to {hdfs_path}: {e}")
+            return False
+        finally:
+            if own_progress:
+                progress.finish()
 
-    def download_file(self, hdfs_path: str, local_path: str):
+    def _append_from(self, local_path: str, part_path: str, size: int, progress: TransferProgress) -> str:
+        """
+        Append the part of local_path that is missing from part_path, retrying from the remote length on errors.
+        :return: The hex SHA-256 of the whole local file.
+        """
+        status = self.client.status(part_path, strict=False)
+        offset = status["length"] if status else 0
+        if offset > size:
+            logging.info(f"{part_path} is longer than {local_path}, starting over")
+            offset = 0
+            status = None
+
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as f:
+            position = 0
+            while position < offset:
+                block = f.read(min(self.chunk_size, offset - position))
+                digest.update(block)
+                position += len(block)
+            if offset and self._remote_digest(part_path, offset) != digest.hexdigest():
+                # Left over from an earlier version of the local file
+                logging.info(f"{part_path} does not match the start of {local_path}, starting over")
+                f.seek(0)
+                digest = hashlib.sha256()
+                position = offset = 0
+                status = None
+            if status is None:
+                self.client.write(part_path, data=b"", overwrite=True)
+            elif offset:
+                logging.info(f"Resuming upload of {local_path} at byte {offset}")
+                progress.add(offset)
+            while True:
+                if self.stop_requested:
+                    raise IOError("Transfer stopped.")
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                for attempt in range(1, self.retries + 1):
+                    try:
+                        self.client.write(part_path, data=chunk, append=True)
+                        break
+                    except Exception as e:
+                        remote = self.client.status(part_path)["length"]
+                        if remote == position + len(chunk):
+                            # The append went through but the response was lost
+                            break
+                        if attempt == self.retries or remote != position:
+                            raise IOError(f"Append to {part_path} at byte {position} failed: {e}")
+                        logging.info(f"Retrying append to {part_path} at byte {position}: {e}")
+                position += len(chunk)
+                progress.add(len(chunk))
+        return digest.hexdigest()
+
+    def _remote_digest(self, hdfs_path: str, length: int) -> str:
+        """Return the hex SHA-256 of the first length bytes of an HDFS file, read in chunk_size ranges."""
+        digest = hashlib.sha256()
+        for offset in range(0, length, self.chunk_size):
+            with self.client.read(hdfs_path, offset=offset, length=min(self.chunk_size, length - offset)) as reader:
+                digest.update(reader.read())
+        return digest.hexdigest()
+
+    def download_file(self, hdfs_path: str, local_path: str, progress=None, streams=None) -> bool:
         """
         Download a file from HDFS to the local system.
+        Large files are read as ranges on parallel streams into local_path.part. The finished ranges are
+        recorded next to it, so an interrupted download only fetches what is missing. The file is checked
+        against hdfs_path.sha256 when that exists, then renamed into place.
         :param hdfs_path: The file path on HDFS.
         :param local_path: The local path to save the file.
+        :param progress: Optional TransferProgress shared with other transfers.
+        :param streams: Parallel ranges for this file, defaults to the handler's streams.
+        :return: True if the file was downloaded and verified.
         """
+        part_path = local_path + PART_SUFFIX
+        state_path = part_path + ".json"
+        streams = self.streams if streams is None else max(1, int(streams))
+        own_progress = progress is None
         try:
-            self.client.download(hdfs_path, local_path)
-            print(f"Successfully downloaded {hdfs_path} to {local_path}")
+            status = self.client.status(hdfs_path)
+            size = status["length"]
+            if own_progress:
+                progress = TransferProgress(f"Download {hdfs_path}", size, self.progress_interval)
+            ranges = [(offset, min(self.chunk_size, size - offset)) for offset in range(0, size, self.chunk_size)]
+
+            state = self._load_download_state(state_path, status)
+            done = set(state["done"])
+            if done and os.path.exists(part_path):
+                logging.info(f"Resuming download of {hdfs_path}, {len(done)}/{len(ranges)} ranges done")
+                progress.add(sum(length for offset, length in ranges if offset in done))
+            else:
+                done = set()
+                state["done"] = []
+            local_dir = os.path.dirname(os.path.abspath(local_path))
+            os.makedirs(local_dir, exist_ok=True)
+            with open(part_path, "ab") as f:
+                if os.path.getsize(part_path) != size:
+                    f.truncate(size)
+
+            state_lock = threading.Lock()
+            fd = os.open(part_path, os.O_WRONLY)
+            try:
+                def fetch(offset, length):
+                    for attempt in range(1, self.retries + 1):
+                        if self.stop_requested:
+                            raise IOError("Transfer stopped.")
+                        try:
+                            with self.client.read(hdfs_path, offset=offset, length=length) as reader:
+                                data = reader.read()
+                            if len(data) != length:
+                                raise IOError(f"Read {len(data)} bytes at {offset}, expected {length}.")
+                            os.pwrite(fd, data, offset)
+                            break
+                        except Exception as e:
+                            if attempt == self.retries:
+                                raise
+                            logging.info(f"Retrying range {offset} of {hdfs_path}: {e}")
+                    progress.add(length)
+                    with state_lock:
+                        state["done"].append(offset)
+                        self._save_download_state(state_path, state)
+
+                missing = [(offset, length) for offset, length in ranges if offset not in done]
+                if len(missing) > 1 and streams > 1:
+                    with ThreadPoolExecutor(max_workers=streams, thread_name_prefix="HDFSRange") as executor:
+                        for future in [executor.submit(fetch, offset, length) for offset, length in missing]:
+                            future.result()
+                else:
+                    for offset, length in missing:
+                        fetch(offset, length)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            expected = self._remote_checksum(hdfs_path)
+            if expected:
+                digest = hashlib.sha256()
+                with open(part_path, "rb") as f:
+                    for block in iter(lambda: f.read(self.chunk_size), b""):
+                        digest.update(block)
+                if digest.hexdigest() != expected:
+                    self._discard(part_path, state_path)
+                    raise IOError(f"Checksum mismatch for {hdfs_path}: expected {expected}, got {digest.hexdigest()}.")
+
+            os.replace(part_path, local_path)
+            self._discard(state_path)
+            logging.info(f"Successfully downloaded {hdfs_path} to {local_path}")
+            return True
         except Exception as e:
-            print(f"Error downloading file: {e}")
+            logging.error(f"Error downloading {hdfs_path} to {local_path}: {e}")
+            return False
+        finally:
+            if own_progress and progress is not None:
+                progress.finish()
+
+    def _remote_checksum(self, hdfs_path: str):
+        """Return the SHA-256 recorded next to hdfs_path, or None when there is none."""
+        checksum_path = hdfs_path + CHECKSUM_SUFFIX
+        if self.client.status(checksum_path, strict=False) is None:
+            return None
+        with self.client.read(checksum_path, encoding="utf-8") as reader:
+            return reader.read().strip()
+
+    def _load_download_state(self, state_path: str, status: dict) -> dict:
+        """Load the finished ranges of an earlier download, if the remote file has not changed since."""
+        fresh = {"length": status["length"], "modified": status.get("modificationTime"), "chunk_size": self.chunk_size, "done": []}
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return fresh
+        if (state.get("length"), state.get("modified"), state.get("chunk_size")) != (fresh["length"], fresh["modified"], fresh["chunk_size"]):
+            return fresh
+        return state
+
+    def _discard(self, *paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _save_download_state(self, state_path: str, state: dict):
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    def upload_directory(self, local_dir: str, hdfs_dir: str, overwrite: bool = True) -> bool:
+        """
+        Upload every file below local_dir to hdfs_dir, streams files at a time.
+        :return: True if every file was uploaded.
+        """
+        files = []
+        for dirpath, _, filenames in os.walk(local_dir):
+            for filename in filenames:
+                if filename.endswith(PART_SUFFIX):
+                    continue
+                local_path = os.path.join(dirpath, filename)
+                relative = os.path.relpath(local_path, local_dir)
+                files.append((local_path, f"{hdfs_dir.rstrip('/')}/{relative.replace(os.sep, '/')}"))
+        progress = TransferProgress(f"Upload {local_dir}", sum(os.path.getsize(path) for path, _ in files), self.progress_interval)
+        for hdfs_parent in {hdfs_path.rsplit("/", 1)[0] for _, hdfs_path in files}:
+            self.client.makedirs(hdfs_parent)
+        with ThreadPoolExecutor(max_workers=self.streams, thread_name_prefix="HDFSUpload") as executor:
+            results = list(executor.map(lambda paths: self.upload_file(paths[0], paths[1], overwrite, progress), files))
+        progress.finish()
+        return all(results)
+
+    def download_directory(self, hdfs_dir: str, local_dir: str) -> bool:
+        """
+        Download every file below hdfs_dir to local_dir, streams files at a time.
+        :return: True if every file was downloaded and verified.
+        """
+        files = []
+        total = 0
+        for dirpath, _, filenames in self.client.walk(hdfs_dir, status=True):
+            dirpath = dirpath[0] if isinstance(dirpath, tuple) else dirpath
+            for filename, status in filenames:
+                if filename.endswith(CHECKSUM_SUFFIX) or filename.endswith(PART_SUFFIX):
+                    continue
+                hdfs_path = f"{dirpath.rstrip('/')}/{filename}"
+                relative = os.path.relpath(hdfs_path, hdfs_dir)
+                files.append((hdfs_path, os.path.join(local_dir, relative)))
+                total += status["length"]
+        progress = TransferProgress(f"Download {hdfs_dir}", total, self.progress_interval)
+        # Files already run in parallel, so each one is fetched on a single stream
+        with ThreadPoolExecutor(max_workers=self.streams, thread_name_prefix="HDFSDownload") as executor:
+            results = list(executor.map(lambda paths: self.download_file(paths[0], paths[1], progress, streams=1), files))
+        progress.finish()
+        return all(results)
 
     def list_directory(self, hdfs_path: str):
         """
@@ -41,22 +358,23 @@ class HDFSHandler:
         """
         try:
             files = self.client.list(hdfs_path)
-            print(f"Files in {hdfs_path}: {files}")
+            logging.info(f"Files in {hdfs_path}: {files}")
             return files
         except Exception as e:
-            print(f"Error listing directory: {e}")
+            logging.error(f"Error listing directory: {e}")
             return []
 
     def delete_file(self, hdfs_path: str):
         """
-        Delete a file on HDFS.
+        Delete a file on HDFS, along with its checksum.
         :param hdfs_path: The file path on HDFS to delete.
         """
         try:
             self.client.delete(hdfs_path)
-            print(f"Successfully deleted {hdfs_path}")
+            self.client.delete(hdfs_path + CHECKSUM_SUFFIX)
+            logging.info(f"Successfully deleted {hdfs_path}")
         except Exception as e:
-            print(f"Error deleting file: {e}")
+            logging.error(f"Error deleting file: {e}")
 
     def file_exists(self, hdfs_path: str) -> bool:
         """
@@ -65,11 +383,11 @@ class HDFSHandler:
         :return: True if the file exists, False otherwise.
         """
         try:
-            return self.client.status(hdfs_path) is not None
+            return self.client.status(hdfs_path, strict=False) is not None
         except Exception as e:
-            print(f"Error checking file existence: {e}")
+            logging.error(f"Error checking file existence: {e}")
             return False
-    
+
     def stop(self):
         """
         Stop the HDFS handler and cancel any ongoing operations.
@@ -77,10 +395,12 @@ class HDFSHandler:
         are either skipped or cleanly interrupted.
         """
         self.stop_requested = True
-        print("HDFSHandler has been stopped. No further operations will be executed.")
+        logging.info("HDFSHandler has been stopped. No further operations will be executed.")
 
 # Example usage:
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     # Set the HDFS URL and user
     hdfs_handler = HDFSHandler(hdfs_url="http://localhost:50070", user="hdfs")
 
@@ -0,0 +1,161 @@
+import time
+import queue
+import threading
+import logging
+import logging.handlers
+
+LOG_FORMAT = "%(asctime)s - %(module)s - %(levelname)s - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_level(name):
+    """
+    Turn a level name like "INFO" into its numeric level.
+    :raises ValueError: If the name is not a known level.
+    """
+    numeric = logging.getLevelName(str(name).strip().upper())
+    if not isinstance(numeric, int):
+        raise ValueError(f"Unknown log level '{name}'.")
+    return numeric
+
+
+def parse_levels(spec):
+    """
+    Parse per-module log levels like "MqttHandler=WARNING,SQLHandler=DEBUG".
+    :return: A dict of module name to numeric level.
+    """
+    levels = {}
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        module, _, level = entry.partition("=")
+        try:
+            levels[module.strip()] = parse_level(level)
+        except ValueError:
+            raise ValueError(f"Unknown log level '{level}' for module '{module}'.")
+    return levels
+
+
+class ModuleLevelFilter(logging.Filter):
+    def __init__(self, default_level=logging.INFO, levels=None):
+        """
+        Drop records below the level configured for the module that logged them.
+        The code logs through the root logger, so records are told apart by record.module.
+        :param default_level: Level for modules without their own entry.
+        :param levels: Dict of module name to level.
+        """
+        super().__init__()
+        self.default_level = default_level
+        self.levels = dict(levels or {})
+
+    def lowest_level(self):
+        """The lowest level any module needs, which the root logger has to let through."""
+        return min([self.default_level] + list(self.levels.values()))
+
+    def filter(self, record):
+        return record.levelno >= self.levels.get(record.module, self.default_level)
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate=10, burst=50, max_level=logging.INFO):
+        """
+        Rate limit per-message logs, per call site.
+        Every (module, line) pair gets a token bucket of burst records refilled at rate records per second.
+        Records above max_level are never limited. When a call site is allowed again, its record
+        says how many were suppressed in between.
+        :param rate: Records per second allowed per call site; 0 disables the limit.
+        :param burst: Records a call site may log at once before it is limited.
+        :param max_level: Highest level that is rate limited.
+        """
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_level = max_level
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def filter(self, record):
+        if self.rate <= 0 or record.levelno > self.max_level:
+            return True
+        key = (record.module, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, suppressed = self.buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self.buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking or raising."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSetup:
+    def __init__(self, log_file="app.log", max_bytes=50*1024*1024, backup_count=5, level="INFO", levels="", rate=10, burst=50, queue_size=10000):
+        """
+        Log through a bounded queue to a background thread writing a rotating file,
+        so the paho thread and the workers never wait for the disk.
+        :param log_file: Path of the log file.
+        :param max_bytes: Size at which the file is rotated.
+        :param backup_count: Number of rotated files to keep.
+        :param level: Default level name.
+        :param levels: Per-module levels, see parse_levels.
+        :param rate: Per call site records per second at INFO and below, see RateLimitFilter.
+        :param burst: Per call site burst size.
+        :param queue_size: Maximum number of records waiting for the writer; newer records are dropped when full.
+        :raises ValueError: If level or levels name an unknown level.
+        """
+        self.module_filter = ModuleLevelFilter(parse_level(level), parse_levels(levels))
+        self.rate_filter = RateLimitFilter(rate, burst)
+        self.queue = queue.Queue(maxsize=int(queue_size))
+
+        self.file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=int(max_bytes), backupCount=int(backup_count))
+        self.file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        self.queue_handler.addFilter(self.module_filter)
+        self.queue_handler.addFilter(self.rate_filter)
+        self.listener = logging.handlers.QueueListener(self.queue, self.file_handler, respect_handler_level=True)
+
+    def start(self):
+        """Install the queue handler on the root logger and start the writer thread."""
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(self.module_filter.lowest_level())
+        self.listener.start()
+
+    def set_levels(self, level=None, levels=None):
+        """
+        Change the default and per-module levels while running.
+        Both are validated first, so a bad name leaves the current levels in place.
+        :raises ValueError: If level or levels name an unknown level.
+        """
+        default_level = parse_level(level) if level is not None else None
+        module_levels = parse_levels(levels) if levels is not None else None
+        if default_level is not None:
+            self.module_filter.default_level = default_level
+        if module_levels is not None:
+            self.module_filter.levels = module_levels
+        logging.getLogger().setLevel(self.module_filter.lowest_level())
+
+    def stop(self):
+        """Flush the queued records and stop the writer thread."""
+        self.listener.stop()
+        logging.getLogger().removeHandler(self.queue_handler)
+        self.file_handler.close()
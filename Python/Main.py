@@ -1,81 +1,260 @@
 import threading
 from FtpMonitor import FtpHandler
-from MqttHandler import MQTTHandler
+from MqttHandler import MQTTHandler, parse_topics, parse_routes as parse_topic_routes
 from SQLHandler import SQLHandler
 from Compare import Compare
-from Test import Test
-import dotenv
+from ResultWriter import ResultWriter
+from Dispatcher import CommandDispatcher, parse_lanes, parse_routes
+from Scheduler import Scheduler, default_plan, load_plan
+from Config import Config
+from AsyncRuntime import AsyncRuntime
+from Metrics import REGISTRY, MetricsServer
+from LogSetup import LogSetup
+from HDFSHandler import HDFSHandler
+from TieredStore import TieredStore
+from Retention import Retention
+from Rescore import Rescorer
+from ModelServer import ModelServer
+import asyncio
 import os
+import signal
 import time
 import logging
 
-def setup_logging(log_file="app.log"):
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.INFO,  # Set the desired logging.info level
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
+def setup_logging(config, log_file="app.log"):
+    log_setup = LogSetup(
+        log_file=config.get("LogFile", log_file),
+        max_bytes=config.get("LogMaxBytes", 50*1024*1024),
+        backup_count=config.get("LogBackupCount", 5),
+        level=config.get("LogLevel", "INFO"),
+        levels=config.get("LogLevels", ""),
+        rate=config.get("LogRate", 10),
+        burst=config.get("LogBurst", 50)
     )
+    log_setup.start()
 
-def main():
+    def reload_levels(old, new):
+        if (old.get("LogLevel"), old.get("LogLevels")) != (new.get("LogLevel"), new.get("LogLevels")):
+            try:
+                log_setup.set_levels(new.get("LogLevel", "INFO"), new.get("LogLevels", ""))
+            except ValueError as e:
+                logging.error(f"Keeping the current log levels: {e}")
+    config.add_listener(reload_levels)
+    return log_setup
 
-    dotenvFile = dotenv.find_dotenv()
-    dotenv.load_dotenv(dotenvFile)
-    WATCH_DIR = os.getenv("FTPHANDLERWATCHDIR")
-    DEST_DIR = os.getenv("FTPHANDLERDESTDIR")
-    Download_dir = os.getenv("FTPDownloadDirPath")
-    BestModelName = os.getenv("BestFilePath")
+def register_gauges(db_handler, result_writer, dispatcher, ftp_handler):
+    """Expose the stats the services already keep, as gauges for current values and counters for running totals."""
+    REGISTRY.gauge("mainserver_result_queue_depth", "Results waiting for the batch writer.",
+                   lambda: result_writer.stats()["queue_depth"])
+    REGISTRY.counter_function("mainserver_result_rows_written_total", "Result rows written by the batch writer.",
+                              lambda: result_writer.stats()["written"])
+    REGISTRY.gauge("mainserver_dispatch_queue_depth", "Commands waiting per dispatch lane.",
+                   lambda: [({"lane": name}, stats["queue_depth"]) for name, stats in dispatcher.stats().items()],
+                   labelnames=("lane",))
+    REGISTRY.counter_function("mainserver_dispatch_rejected_total", "Commands rejected or dropped per dispatch lane.",
+                              lambda: [({"lane": name}, stats["rejected"] + stats["dropped"]) for name, stats in dispatcher.stats().items()],
+                              labelnames=("lane",))
+    REGISTRY.gauge("mainserver_ftp_pending_uploads", "Uploads waiting to become stable.",
+                   lambda: len(ftp_handler.pending))
+    REGISTRY.gauge("mainserver_user_cache_entries", "Usernames in the USERID cache.",
+                   lambda: db_handler.user_cache_stats()["size"])
+    REGISTRY.counter_function("mainserver_user_cache_hits_total", "USERID cache lookups answered from memory.",
+                              lambda: db_handler.user_cache_stats()["hits"])
+    REGISTRY.counter_function("mainserver_user_cache_misses_total", "USERID cache lookups that went to the database.",
+                              lambda: db_handler.user_cache_stats()["misses"])
+
+def main(config=None):
+
+    config = config if config else Config()
+    runtime_mode = config.get("RuntimeMode", "threads")
+    WATCH_DIR = config.get("FTPHANDLERWATCHDIR")
+    DEST_DIR = config.get("FTPHANDLERDESTDIR")
+    Download_dir = config.get("FTPDownloadDirPath")
+    BestModelName = config.get("BestFilePath")
 
     db_handler = SQLHandler(
-        host=os.getenv("SQLHOST"),
-        user=os.getenv("DBUSER"),
-        password=os.getenv("DBPASSWORD"),
-        database=os.getenv("DBDB")
+        host=config.get("SQLHOST"),
+        user=config.get("DBUSER"),
+        password=config.get("DBPASSWORD"),
+        database=config.get("DBDB"),
+        pool_size=config.get("DBPoolSize", 4),
+        stale_after=config.get("DBStaleAfter", 60),
+        user_cache_size=config.get("UserCacheSize", 1024)
+    )
+
+    result_writer = ResultWriter(
+        db_handler=db_handler,
+        batch_size=config.get("ResultBatchSize", 200),
+        flush_interval=config.get("ResultFlushInterval", 0.5),
+        max_queue=config.get("ResultQueueSize", 10000)
+    )
+    result_writer.start()
+
+    dispatcher = CommandDispatcher(
+        lanes=parse_lanes(config.get("DispatchLanes", "default:4:1000:block")),
+        routes=parse_routes(config.get("DispatchRoutes", ""))
     )
+    dispatcher.start()
 
     mqtt_handler = MQTTHandler(
-        broker=os.getenv("MQTTBROKER"),
-        port=int(os.getenv("MQTTPORT")),
-        topics=[os.getenv("MQTTTOPICS")],
-        username=os.getenv("MQTTUSERNAME"),
-        password=os.getenv("MQTTPASSWORD"),
-        db_handler=db_handler
+        broker=config.get("MQTTBROKER"),
+        port=int(config.get("MQTTPORT")),
+        topics=parse_topics(config.get("MQTTTOPICS")),
+        routes=parse_topic_routes(config.get("MQTTROUTES", "")),
+        username=config.get("MQTTUSERNAME"),
+        password=config.get("MQTTPASSWORD"),
+        db_handler=db_handler,
+        result_writer=result_writer,
+        config=config,
+        dispatcher=dispatcher,
+        start_loop=runtime_mode != "asyncio"
     )
 
+    tiered_store = None
+    if int(config.get("ModelStoreBudget", 0)):
+        hdfs_handler = HDFSHandler(
+            hdfs_url=config.get("HDFSURL"),
+            user=config.get("HDFSUSER"),
+            streams=config.get("HDFSStreams", 4)
+        )
+        tiered_store = TieredStore(
+            root=DEST_DIR,
+            hdfs_handler=hdfs_handler,
+            archive_dir=config.get("HDFSArchiveDir", "/mainserver/models"),
+            budget_bytes=config.get("ModelStoreBudget"),
+            db_handler=db_handler,
+            durability=config.get("FtpDurability", "file"),
+            min_age=config.get("ModelStoreMinAge", 3600)
+        )
+
     ftp_handler = FtpHandler(
         watch_dir=WATCH_DIR,
         dest_dir=DEST_DIR,
         mqtt_handler=mqtt_handler,
-        topic=os.getenv("FTPHANDLERTOPIC")
+        topic=config.get("FTPHANDLERTOPIC"),
+        stability_window=config.get("FtpStabilityWindow", 5),
+        workers=config.get("FtpWorkers", 4),
+        durability=config.get("FtpDurability", "file"),
+        db_handler=db_handler,
+        tiered_store=tiered_store
     )
     
-    interval = os.getenv("Interval")
-    threshold_percentage = os.getenv("thresholdPercentage")
+    interval = config.get("Interval")
+    threshold_percentage = config.get("thresholdPercentage")
     compare_handler = Compare(
         db_handler=db_handler,
         mqtt_handler=mqtt_handler,
         interval=interval,
         threshold_percentage=threshold_percentage,
+        debounce=config.get("CompareDebounce", 1),
+        durability=config.get("FtpDurability", "file"),
         dest_dir=Download_dir,
         model_dir=DEST_DIR,
-        bestagentname=BestModelName
+        bestagentname=BestModelName,
+        config=config,
+        notify_mode=config.get("NotifyMode", "per_user"),
+        broadcast_topic=config.get("BroadcastTopic", "all/Commands"),
+        legacy_clients=[user.strip() for user in config.get("LegacyClients", "").split(",") if user.strip()],
+        tiered_store=tiered_store
     )
+    if tiered_store:
+        tiered_store.add_protector(lambda: [compare_handler.promoted_hash])
+        tiered_store.start()
     
+    rescorer = Rescorer(db_handler, config, chunk_size=config.get("RescoreChunkSize", 5000), settle=config.get("RescoreSettle", 5))
+    rescorer.add_listener(compare_handler.reset_best)
+    config.add_listener(rescorer.on_config_change)
+
+    retention = Retention(
+        db_handler=db_handler,
+        keep_per_user=config.get("RetentionKeepPerUser", 0),
+        max_age_days=config.get("RetentionMaxAgeDays", 0),
+        batch_size=config.get("RetentionBatchSize", 1000),
+        interval=config.get("RetentionInterval", 300)
+    )
+    if retention.enabled():
+        retention.start()
+
+    model_server = None
+    model_server_port = int(config.get("ModelServerPort", 0))
+    if model_server_port:
+        best_path = os.path.join(Download_dir, BestModelName)
+
+        def known_model_hash(file_path):
+            # The best file is the promoted model; user models are recorded in ModelFiles
+            if file_path == best_path:
+                return compare_handler.promoted_hash
+            return db_handler.get_model_hash(os.path.basename(file_path))
+
+        model_server = ModelServer(
+            best_path=best_path,
+            model_dir=DEST_DIR,
+            port=model_server_port,
+            host=config.get("ModelServerHost", "0.0.0.0"),
+            max_transfers=config.get("ModelServerMaxTransfers", 8),
+            hash_lookup=known_model_hash
+        )
+        model_server.start()
+
+    metrics_server = None
+    metrics_port = int(config.get("MetricsPort", 9108))
+    if metrics_port:
+        register_gauges(db_handler, result_writer, dispatcher, ftp_handler)
+        metrics_server = MetricsServer(port=metrics_port, host=config.get("MetricsHost", "127.0.0.1"))
+        metrics_server.start()
+
     # Create a threading event for graceful shutdown
     stop_event = threading.Event()
     
-    # Pass stop_event to Test
-    test = Test(mqtt_handler=mqtt_handler, stop_event=stop_event)
+    # Pass stop_event to the Scheduler
+    plan_path = config.get("ExperimentPlan")
+    scheduler = Scheduler(
+        mqtt_handler=mqtt_handler,
+        stop_event=stop_event,
+        plan=load_plan(plan_path) if plan_path else default_plan(),
+        state_path=config.get("ExperimentState", "experiment_state.json"),
+        db_handler=db_handler,
+        config=config
+    )
+
+    if runtime_mode == "asyncio":
+        runtime = AsyncRuntime(
+            mqtt_handler=mqtt_handler,
+            ftp_handler=ftp_handler,
+            compare_handler=compare_handler,
+            scheduler=scheduler,
+            stop_event=stop_event,
+            executor_workers=config.get("AsyncExecutorWorkers", 8)
+        )
+        mqtt_handler.add_result_listener(runtime.notify_compare)
+        rescorer.add_listener(runtime.notify_compare)
+    else:
+        mqtt_handler.add_result_listener(compare_handler.notify)
+
+    # run.sh stops the server with SIGTERM; shut down like a finished plan so queued results are written
+    def handle_sigterm(signum, frame):
+        logging.info("Received SIGTERM, stopping...")
+        if runtime_mode == "asyncio":
+            runtime.request_stop()
+        else:
+            stop_event.set()
+    signal.signal(signal.SIGTERM, handle_sigterm)
 
     def run_compare():
         logging.info("Starting Compare thread...")
         compare_handler.run()
 
-    def run_test():
-        logging.info("Starting Test thread...")
-        test.loop()
+    def run_scheduler():
+        logging.info("Starting Scheduler thread...")
+        scheduler.loop()
 
+    compare_thread = None
     try:
+        if runtime_mode == "asyncio":
+            logging.info("Starting the async runtime...")
+            asyncio.run(runtime.run())
+            return
+
         # Start services
         ftp_handler.start()
 
@@ -83,12 +262,12 @@ def main():
         compare_thread.start()
 
 
-        test_thread = threading.Thread(target=run_test, daemon=True)
-        test_thread.start()
+        scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+        scheduler_thread.start()
 
 
 
-        logging.info("Press Enter to stop, or wait for the test to finish...")
+        logging.info("Press Enter to stop, or wait for the experiment plan to finish...")
 
         while not stop_event.is_set():
             time.sleep(1)
@@ -96,15 +275,36 @@ def main():
         logging.info("Exiting program...")
 
     finally:
-
-        ftp_handler.stop()
-        mqtt_handler.stop()
-        db_handler.close()
-        compare_handler.stop()
+        # Every step runs even if an earlier one fails, so queued results are written and the pool is closed
+        shutdown_steps = [
+            ("FtpHandler", ftp_handler.stop),
+            ("MQTTHandler", mqtt_handler.stop),
+            ("CommandDispatcher", dispatcher.stop),
+            ("ResultWriter", result_writer.stop),
+            ("Compare", compare_handler.stop),
+            ("Compare thread", compare_thread.join if compare_thread else None),
+            ("TieredStore", tiered_store.stop if tiered_store else None),
+            ("Retention", retention.stop),
+            ("ModelServer", model_server.stop if model_server else None),
+            ("MetricsServer", metrics_server.stop if metrics_server else None),
+            # Last, once nothing running in the background can open a new pool connection
+            ("SQLHandler", db_handler.close),
+        ]
+        for name, stop in shutdown_steps:
+            if stop is None:
+                continue
+            try:
+                stop()
+            except Exception as e:
+                logging.error(f"Error stopping {name}: {e}")
 
         logging.info("Stopped all services.")
 
 if __name__ == "__main__":
-    setup_logging() 
+    config = Config()
+    log_setup = setup_logging(config)
     logging.info("Starting the application...")
-    main()
+    try:
+        main(config)
+    finally:
+        log_setup.stop()
@@ -0,0 +1,266 @@
+import time
+import bisect
+import threading
+import functools
+import logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labelnames, labels):
+    """Turn keyword labels into a tuple of values ordered like labelnames."""
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {tuple(labels)}.")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, values, extra=()):
+    """Format label names and values in the Prometheus text format, like {command="NewUser"}."""
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        """
+        A monotonically increasing counter.
+        :param name: Metric name.
+        :param help_text: Description shown in the HELP line.
+        :param labelnames: Names of the labels every increment has to carry.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter for the given labels."""
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        with self.lock:
+            values = dict(self.values)
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        A histogram of observed values, with cumulative buckets, a sum and a count.
+        :param name: Metric name.
+        :param help_text: Description shown in the HELP line.
+        :param labelnames: Names of the labels every observation has to carry.
+        :param buckets: Upper bounds of the buckets, in increasing order.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def observe(self, value, **labels):
+        """Record one observation for the given labels."""
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how many seconds the with block took."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self):
+        with self.lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self.values.items()}
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text, labelnames=(), function=None, metric_type="gauge"):
+        """
+        A value read when the metrics are scraped.
+        :param name: Metric name.
+        :param help_text: Description shown in the HELP line.
+        :param labelnames: Names of the labels.
+        :param function: Callable returning a number, or a list of (labels dict, value) pairs when labelnames is set.
+        :param metric_type: "gauge", or "counter" for running totals kept elsewhere, so rate() works on them.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self.metric_type = metric_type
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        try:
+            value = self.function()
+        except Exception as e:
+            logging.error(f"Error reading gauge {self.name}: {e}")
+            return lines
+        samples = value if self.labelnames else [({}, value)]
+        for labels, sample in samples:
+            key = _label_key(self.labelnames, labels)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(sample)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        """A set of metrics rendered together in the Prometheus text format."""
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        """Add a metric, replacing one with the same name."""
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, function, labelnames=()):
+        return self.register(Gauge(name, help_text, labelnames, function))
+
+    def counter_function(self, name, help_text, function, labelnames=()):
+        """Export a running total that another object keeps as a counter, read when scraped."""
+        return self.register(Gauge(name, help_text, labelnames, function, metric_type="counter"))
+
+    def render(self):
+        """Return all metrics as Prometheus text exposition."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+MQTT_MESSAGES = REGISTRY.counter("mainserver_mqtt_messages_total", "MQTT commands received.", ("command",))
+HANDLER_SECONDS = REGISTRY.histogram("mainserver_handler_seconds", "Time spent in MQTT command handlers.", ("command",))
+HANDLER_ERRORS = REGISTRY.counter("mainserver_handler_errors_total", "MQTT command handlers that raised.", ("command",))
+DB_SECONDS = REGISTRY.histogram("mainserver_db_seconds", "Time spent in SQLHandler methods.", ("method",))
+DB_ERRORS = REGISTRY.counter("mainserver_db_errors_total", "SQLHandler methods that raised.", ("method",))
+FTP_FILES = REGISTRY.counter("mainserver_ftp_files_total", "Uploads processed by the FtpMonitor.", ("result",))
+FTP_BYTES = REGISTRY.counter("mainserver_ftp_bytes_total", "Bytes of uploads moved into the model store.")
+COMPARE_SECONDS = REGISTRY.histogram("mainserver_compare_seconds", "Time spent evaluating the newest models.")
+COMPARE_PROMOTIONS = REGISTRY.counter("mainserver_compare_promotions_total", "Models published as the best model.")
+MODEL_REQUESTS = REGISTRY.counter("mainserver_model_requests_total", "Model server responses.", ("status",))
+MODEL_BYTES = REGISTRY.counter("mainserver_model_bytes_total", "Bytes of models sent by the model server.")
+
+
+def timed(histogram, errors=None, **labels):
+    """
+    Decorator observing the duration of every call in histogram, and counting exceptions in errors.
+    Exceptions are re-raised unchanged.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(**labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+def timed_db(func):
+    """Time an SQLHandler method under its own name."""
+    return timed(DB_SECONDS, DB_ERRORS, method=func.__name__)(func)
+
+
+class MetricsServer:
+    def __init__(self, port, host="127.0.0.1", registry=REGISTRY):
+        """
+        Serve the metrics registry over HTTP on /metrics.
+        :param port: Port to listen on.
+        :param host: Address to bind; local only by default.
+        :param registry: The registry to export.
+        """
+        self.host = host
+        self.port = int(port)
+        self.registry = registry
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        """Start serving on a background thread."""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+        self.thread.start()
+        logging.info(f"Metrics available on http://{self.host}:{self.server.server_address[1]}/metrics")
+
+    def stop(self):
+        """Stop the HTTP server."""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            logging.info("Metrics server stopped.")
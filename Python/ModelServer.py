@@ -0,0 +1,241 @@
+import os
+import re
+import hashlib
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import Metrics
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    Parse a single HTTP byte range against a file size.
+    :return: (start, end) with end inclusive, None to send the whole file, or False if the range is unsatisfiable.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if size == 0:
+        # No byte of an empty file can be addressed, so the range is ignored
+        return None
+    if not match or match.group(1) == match.group(2) == "":
+        # Multiple or malformed ranges, answered with the whole file
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class ModelServer:
+    def __init__(self, best_path, model_dir, port, host="0.0.0.0", max_transfers=8, chunk_size=1024 * 1024, hash_lookup=None):
+        """
+        Serve the best model and per-user models over HTTP.
+        GET /best serves best_path and GET /models/<username>/<filename> serves a model from model_dir.
+        Responses carry the model's SHA-256 as ETag, so clients that already have it get a 304 for
+        If-None-Match, and Range requests let interrupted downloads resume. Bodies are sent with sendfile.
+        :param best_path: Path of the published best model.
+        :param model_dir: Directory of the per-user models, the root of the ModelStore.
+        :param port: Port to listen on.
+        :param host: Address to bind.
+        :param max_transfers: Maximum number of bodies sent at once; further requests get a 503.
+        :param chunk_size: Bytes read per step while hashing a model.
+        :param hash_lookup: Optional callable(file_path) returning the SHA-256 the server already knows for a
+                            file, like ModelFiles.ModelHash or the promoted hash. A digest is only used when
+                            the file is a hardlink of that blob in the store; otherwise the file is hashed.
+        """
+        self.best_path = best_path
+        self.model_dir = model_dir
+        self.blob_dir = os.path.join(model_dir, ".blobs")
+        self.host = host
+        self.port = int(port)
+        self.max_transfers = int(max_transfers)
+        self.transfers = threading.BoundedSemaphore(self.max_transfers)
+        self.chunk_size = int(chunk_size)
+        self.hash_lookup = hash_lookup
+        self.hashes = {}
+        self.hash_lock = threading.Lock()
+        self.key_locks = {}
+        self.server = None
+        self.thread = None
+
+    def resolve(self, path):
+        """Map a request path to a local file path, or None if it names no model."""
+        path = path.split("?", 1)[0]
+        if path == "/best":
+            return self.best_path
+        parts = path.split("/")
+        if len(parts) == 4 and parts[1] == "models":
+            username, filename = parts[2], parts[3]
+            if username and filename and not username.startswith(".") and not filename.startswith("."):
+                return os.path.join(self.model_dir, username, filename)
+        return None
+
+    def etag(self, fd, stat, file_path):
+        """
+        Return the quoted SHA-256 of an open model file.
+        Models are never modified in place, only replaced, so hashes are cached per inode and mtime.
+        """
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self.hash_lock:
+            digest = self.hashes.get(key)
+        if digest is None:
+            digest = self.known_digest(file_path, stat)
+            if digest is not None:
+                self.remember(key, digest)
+            else:
+                digest = self.hash_file(fd, stat, key)
+        return f'"{digest}"'
+
+    def remember(self, key, digest):
+        with self.hash_lock:
+            if len(self.hashes) > 1024:
+                self.hashes.clear()
+            self.hashes[key] = digest
+
+    def known_digest(self, file_path, stat):
+        """Return the digest hash_lookup knows for file_path if the open file is that blob, else None."""
+        if self.hash_lookup is None:
+            return None
+        try:
+            digest = self.hash_lookup(file_path)
+        except Exception as e:
+            logging.error(f"Error looking up the hash of {file_path}: {e}")
+            return None
+        if not digest:
+            return None
+        try:
+            blob_stat = os.stat(os.path.join(self.blob_dir, digest[:2], digest))
+        except OSError:
+            return None
+        if (blob_stat.st_dev, blob_stat.st_ino) != (stat.st_dev, stat.st_ino):
+            return None
+        return digest
+
+    def hash_file(self, fd, stat, key):
+        """Hash an open file, once per key even when many clients ask at once, like right after a promotion."""
+        with self.hash_lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                with self.hash_lock:
+                    digest = self.hashes.get(key)
+                if digest is not None:
+                    return digest
+                sha = hashlib.sha256()
+                offset = 0
+                while offset < stat.st_size:
+                    block = os.pread(fd, self.chunk_size, offset)
+                    if not block:
+                        break
+                    sha.update(block)
+                    offset += len(block)
+                digest = sha.hexdigest()
+                self.remember(key, digest)
+                return digest
+        finally:
+            with self.hash_lock:
+                if self.key_locks.get(key) is key_lock and not key_lock.locked():
+                    del self.key_locks[key]
+
+    def start(self):
+        """Start serving on a background thread."""
+        model_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                self.serve(send_body=False)
+
+            def do_GET(self):
+                self.serve(send_body=True)
+
+            def serve(self, send_body):
+                file_path = model_server.resolve(self.path)
+                if file_path is None:
+                    self.reply(404)
+                    return
+                try:
+                    fd = os.open(file_path, os.O_RDONLY)
+                except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+                    self.reply(404)
+                    return
+                try:
+                    # Everything is read from the open descriptor, so a promotion replacing the file mid-request is harmless
+                    stat = os.fstat(fd)
+                    etag = model_server.etag(fd, stat, file_path)
+                    if_none_match = self.headers.get("If-None-Match")
+                    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+                        self.reply(304, {"ETag": etag})
+                        return
+
+                    size = stat.st_size
+                    byte_range = None
+                    if_range = self.headers.get("If-Range")
+                    if not if_range or if_range.strip() == etag:
+                        byte_range = parse_range(self.headers.get("Range"), size)
+                    if byte_range is False:
+                        self.reply(416, {"Content-Range": f"bytes */{size}"})
+                        return
+                    start, end = byte_range if byte_range else (0, size - 1)
+                    length = end - start + 1 if size else 0
+
+                    if send_body and not model_server.transfers.acquire(blocking=False):
+                        self.reply(503, {"Retry-After": "5"})
+                        return
+                    try:
+                        status = 206 if byte_range else 200
+                        headers = {
+                            "ETag": etag,
+                            "Accept-Ranges": "bytes",
+                            "Content-Type": "application/octet-stream",
+                            "Cache-Control": "no-cache",
+                        }
+                        if byte_range:
+                            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+                        self.reply(status, headers, length)
+                        if send_body and length:
+                            with os.fdopen(os.dup(fd), "rb") as f:
+                                sent = self.connection.sendfile(f, start, length)
+                            Metrics.MODEL_BYTES.inc(sent)
+                    finally:
+                        if send_body:
+                            model_server.transfers.release()
+                except (BrokenPipeError, ConnectionResetError):
+                    logging.info(f"Client {self.client_address[0]} closed the connection during {self.path}")
+                finally:
+                    os.close(fd)
+
+            def reply(self, status, headers=None, length=0):
+                Metrics.MODEL_REQUESTS.inc(status=status)
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(length))
+                self.end_headers()
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                logging.debug(f"ModelServer {self.client_address[0]}: {format % args}")
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="ModelServer", daemon=True)
+        self.thread.start()
+        logging.info(f"ModelServer serving models on http://{self.host}:{self.server.server_address[1]}/best")
+
+    def stop(self):
+        """Stop the HTTP server."""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            logging.info("ModelServer stopped.")
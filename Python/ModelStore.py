@@ -0,0 +1,108 @@
+import os
+import hashlib
+import tempfile
+import threading
+import logging
+from FileUtils import DURABILITY_POLICIES, same_device, hash_file, fsync_file, fsync_dir
+
+class ModelStore:
+    def __init__(self, root, durability="file", chunk_size=1024 * 1024):
+        """
+        Initialize the content-addressed model store.
+        Blobs live under <root>/.blobs/<hash[:2]>/<hash>, and <root>/<username>/<filename> are hardlinks to them,
+        so identical models uploaded under different names share one copy on disk.
+        :param root: The directory the models are stored in.
+        :param durability: fsync policy for stored files, one of "none", "file" or "full".
+        :param chunk_size: Bytes read per step while hashing and copying.
+
+        lock guards adding and linking blobs; a TieredStore holds it while it removes them.
+        """
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy '{durability}'.")
+        self.root = root
+        self.blob_dir = os.path.join(root, ".blobs")
+        self.durability = durability
+        self.chunk_size = int(chunk_size)
+        self.lock = threading.RLock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def blob_path(self, digest):
+        """Return the path of the blob with the given SHA-256 hex digest."""
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def user_path(self, username, file_name):
+        """Return the per-user path a model is visible under."""
+        return os.path.join(self.root, username, file_name)
+
+    def ingest(self, src_path, username, file_name):
+        """
+        Move an uploaded file into the store and link it under the user's directory.
+        The SHA-256 is computed while the file is read for the move.
+        :return: A (digest, size, deduplicated) tuple.
+        """
+        if same_device(src_path, self.blob_dir):
+            # A rename moves no data, so the only read needed is the one for the hash
+            digest = hash_file(src_path, self.chunk_size)
+            staged_path = src_path
+        else:
+            staged_path, digest = self._copy_and_hash(src_path)
+        size = os.stat(staged_path).st_size
+
+        blob = self.blob_path(digest)
+        dest_path = self.user_path(username, file_name)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        with self.lock:
+            deduplicated = os.path.exists(blob)
+            if deduplicated:
+                # Link before dropping the upload, so it is never gone without a copy in the store
+                self._link(blob, dest_path)
+                os.remove(staged_path)
+                logging.info(f"Model {file_name} is a duplicate of blob {digest}")
+            else:
+                if self.durability != "none" and staged_path == src_path:
+                    fsync_file(staged_path)
+                os.chmod(staged_path, 0o444)
+                os.replace(staged_path, blob)
+                self._link(blob, dest_path)
+        if staged_path != src_path:
+            os.remove(src_path)
+
+        if self.durability == "full":
+            fsync_dir(os.path.dirname(blob))
+            fsync_dir(os.path.dirname(dest_path))
+        return digest, size, deduplicated
+
+    def link(self, digest, username, file_name):
+        """Make an existing blob visible under the user's directory again."""
+        dest_path = self.user_path(username, file_name)
+        with self.lock:
+            self._link(self.blob_path(digest), dest_path)
+        if self.durability == "full":
+            fsync_dir(os.path.dirname(dest_path))
+        return dest_path
+
+    def _copy_and_hash(self, src_path):
+        """Copy a file into a temp file in the blob directory, hashing it on the way."""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, prefix=".", suffix=".tmp")
+        try:
+            with open(src_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+                for chunk in iter(lambda: src.read(self.chunk_size), b""):
+                    digest.update(chunk)
+                    dst.write(chunk)
+                dst.flush()
+                if self.durability != "none":
+                    os.fsync(dst.fileno())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest()
+
+    def _link(self, blob, dest_path):
+        """Atomically point dest_path at a blob."""
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(dest_path), f".{os.path.basename(dest_path)}.{os.getpid()}.link")
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        os.link(blob, tmp_path)
+        os.replace(tmp_path, dest_path)
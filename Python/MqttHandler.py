@@ -1,34 +1,76 @@
 import paho.mqtt.client as mqtt
 import ssl
-import dotenv
-import os
 import logging
+from Config import Config
+import Codec
+import Rescore
+import Metrics
+
+def parse_topics(spec):
+    """
+    Parse a comma separated topic list with optional QoS, like "Server/+/Results:1,Server/+/Control".
+    :return: A list of (topic_filter, qos) tuples.
+    """
+    topics = []
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        topic, _, qos = entry.partition(":")
+        topics.append((topic.strip(), int(qos) if qos else 0))
+    return topics
+
+def parse_routes(spec):
+    """
+    Parse a comma separated list of command routes, like "Server/+/Results=TestResultat:1".
+    :return: A list of (topic_filter, command, qos) tuples.
+    """
+    routes = []
+    for topic, qos in parse_topics(spec):
+        topic_filter, _, command = topic.partition("=")
+        routes.append((topic_filter.strip(), command.strip(), qos))
+    return routes
 
 class MQTTHandler:
-    def __init__(self, broker, port, topics=None, username=None, password=None, db_handler=None):
+    def __init__(self, broker, port, topics=None, username=None, password=None, db_handler=None, result_writer=None, config=None, dispatcher=None, routes=None, start_loop=True, client=None):
         """
         Initialize the MQTT handler.
         :param broker: MQTT broker address.
         :param port: Port to connect to the broker.
-        :param topics: List of topics to subscribe to.
+        :param topics: List of topic filters to subscribe to, as strings or (topic_filter, qos) tuples.
+                       Messages on them carry 'command|data' payloads.
         :param username: Username for MQTT authentication.
         :param password: Password for MQTT authentication.
+        :param db_handler: The database handler class.
+        :param result_writer: Optional ResultWriter; test results are queued to it instead of inserted directly.
+        :param config: Shared Config, a new one reading .env is created when None.
+        :param dispatcher: Optional CommandDispatcher running handlers off the paho network thread.
+        :param routes: List of (topic_filter, command, qos) tuples for topics whose payload is only the data of one command.
+        :param start_loop: Connect and start paho's network thread right away. When False, the caller drives the
+                           client itself, like the asyncio runtime does.
+        :param client: Optional paho-compatible client to use instead of creating one, like the benchmark's fake client.
         """
         self.broker = broker
         self.port = port
-        self.topics = topics if topics else []
+        self.topics = [topic if isinstance(topic, tuple) else (topic, 0) for topic in (topics or []) if topic]
+        self.subscriptions = {}
         self.username = username
         self.password = password
         self.db_handler=db_handler
+        self.result_writer=result_writer
+        self.result_listeners=[]
+        self.config=config if config else Config()
+        self.dispatcher=dispatcher
 
-        self.client = mqtt.Client(client_id="", userdata=None)
+        self.client = client if client else mqtt.Client(client_id="", userdata=None)
         self.client.on_connect = self.on_connect  
 
         self.client.tls_set(tls_version=ssl.PROTOCOL_TLS)
         if self.username and self.password:
             self.client.username_pw_set(self.username, self.password)
         
-        self.client.connect(self.broker, self.port)
+        if start_loop:
+            self.client.connect(self.broker, self.port)
 
         self.client.on_subscribe = self.on_subscribe
         self.client.on_message = self.on_message
@@ -42,15 +84,63 @@ class MQTTHandler:
         # Add more commands here if necessary
         }
 
-        self.client.loop_start()
+        for topic_filter, qos in self.topics:
+            self.add_route(topic_filter, qos=qos)
+        for topic_filter, command, qos in (routes or []):
+            self.add_route(topic_filter, command=command, qos=qos)
+
+        if start_loop:
+            self.client.loop_start()
     
     def start(self):
         """Start the MQTT handler by subscribing to topics."""
-        for topic in self.topics:
-            self.client.subscribe(topic)
-            logging.info(f"Subscribed to topic: {topic}")
+        if self.subscriptions:
+            self.client.subscribe(list(self.subscriptions.items()))
+            for topic, qos in self.subscriptions.items():
+                logging.info(f"Subscribed to topic: {topic} with QoS {qos}")
         logging.info("MQTTHandler started and listening for messages.")
 
+    def add_route(self, topic_filter, handler=None, command=None, qos=0):
+        """
+        Route messages matching an MQTT topic filter straight to a handler through paho's per-topic callbacks.
+        The username is taken from the filter's first '+' level, so 'Server/+/Results' yields the user of
+        'Server/bob/Results'. Filters should not overlap, since paho calls every matching callback.
+        :param topic_filter: The topic filter, wildcards allowed.
+        :param handler: Callable(payload, username); defaults to handle_message, or the command's handler when command is set.
+        :param command: Treat the whole payload as the data of this command instead of parsing 'command|data'.
+        :param qos: QoS to subscribe with.
+        """
+        if handler is None:
+            if command:
+                handler = lambda payload, username: self.handle_command(command, Codec.decode_data(payload), username)
+            else:
+                handler = self.handle_message
+
+        levels = topic_filter.split("/")
+        if "+" in levels:
+            user_level = levels.index("+")
+            prefix = "/".join(levels[:user_level]) + "/" if user_level else ""
+        else:
+            user_level = None
+            prefix = None
+
+        def callback(client, userdata, msg):
+            topic = msg.topic
+            if user_level is None:
+                username = self.extract_username(topic)
+            elif topic.startswith(prefix):
+                username = topic[len(prefix):].split("/", 1)[0]
+            else:
+                username = topic.split("/")[user_level]
+            logging.info(f"Received message on topic {topic}: {msg.payload[:200]!r}")
+            try:
+                handler(msg.payload, username)
+            except ValueError as e:
+                logging.error(f"Error processing message on {topic}: {e}")
+
+        self.client.message_callback_add(topic_filter, callback)
+        self.subscriptions[topic_filter] = qos
+
     def stop(self):
         """Stop the MQTT handler and disconnect from the broker."""
         self.client.loop_stop() 
@@ -65,22 +155,27 @@ class MQTTHandler:
         else:
             logging.error(f"Connection failed with code {rc}")
 
+    def add_result_listener(self, callback):
+        """Register a callback that is called without arguments once new test results are stored."""
+        if self.result_writer:
+            self.result_writer.add_listener(callback)
+        else:
+            self.result_listeners.append(callback)
+
     def send_message(self, topic, message):
         """Publish a message to a specific topic."""
         self.client.publish(topic, message)
 
     def on_message(self, client, userdata, msg):
         """Callback for when a message is received."""
-        message = msg.payload.decode('utf-8')
         topic = msg.topic
-        logging.info(topic)
         username = self.extract_username(topic)
-        logging.info(f"Received message on topic {topic}: {message}")
-        self.handle_message(message, username)
+        logging.info(f"Received message on topic {topic}: {msg.payload[:200]!r}")
+        self.handle_message(msg.payload, username)
 
     def on_publish(self, client, userdata, mid):
         """Callback for when a message is successfully published."""
-        logging.info(f"Message published with mid: {mid}")
+        logging.debug(f"Message published with mid: {mid}")
 
     def on_subscribe(self, client, userdata, mid, granted_qos):
         """Callback for when a subscription is confirmed."""
@@ -107,71 +202,81 @@ class MQTTHandler:
             return None
 
     def handle_message(self, message, username):
-        """Process the received message."""
+        """
+        Process the received message.
+        :param message: The raw payload, either legacy 'command|data' text or a structured payload (see Codec).
+        """
         try:
-            command, data = self.parse_message(message)
-            handler = self.command_dispatcher.get(command, self.handle_unknown)
-            if handler != self.handle_unknown:
-                handler(data,username)
-            else:
-                handler(command, username)
+            for command, data in Codec.decode(message):
+                self.handle_command(command, data, username)
         except ValueError as e:
             logging.error(f"Error processing message: {e}")
 
+    def handle_command(self, command, data, username):
+        """Run the handler of a command, on the dispatcher when one is set."""
+        handler = self.command_dispatcher.get(command, self.handle_unknown)
+        if handler != self.handle_unknown:
+            args = (data, username)
+            label = command
+        else:
+            args = (command, username)
+            # Clients choose the command name, so unknown ones share a label instead of adding a series each
+            label = "unknown"
+        Metrics.MQTT_MESSAGES.inc(command=label)
+        if self.dispatcher:
+            self.dispatcher.submit(command, username, self.run_handler, label, handler, *args)
+        else:
+            self.run_handler(label, handler, *args)
+
+    def run_handler(self, label, handler, *args):
+        """Run a command handler and record its latency under the given command label."""
+        with Metrics.HANDLER_SECONDS.time(command=label):
+            try:
+                handler(*args)
+            except Exception:
+                Metrics.HANDLER_ERRORS.inc(command=label)
+                raise
+
     def parse_message(self, message):
-        """Parse a message into command and data."""
-        try:
-            command, data = message.split("|", 1)  
-            return command, data
-        except ValueError:
-            raise ValueError("Invalid message format. Expected 'command|data...'.")
+        """Parse a legacy message into command and data."""
+        return Codec.decode_legacy(message)
 
 
     def handle_testResult(self, data, username):
-        """Handle the 'TestResult' command and compute ModelScore."""
+        """
+        Handle the 'TestResult' command and compute ModelScore.
+        :param data: Legacy 'FileName|rewardMean|rewardStd' text or a list of results from a structured payload.
+        """
         logging.info(f"Processing test for user {username}, with data {data}")
         try:
-            dotenvFile = dotenv.find_dotenv()
-            dotenv.load_dotenv(dotenvFile, override=True)
-            mean_weight = float(os.getenv("meanWeight"))
-            std_weight = float(os.getenv("stdWeight"))
+            config = self.config.snapshot()
+            results = Codec.parse_results(data)
 
-            FileName, rewardMean, rewardStd = data.split("|", 2)
-        
-            # Convert the values
-            reward_mean = float(rewardMean)
-            reward_std = float(rewardStd)
+            # Calculate ModelScore with the configured formula, the same one rescoring uses
+            scores = Rescore.score_many(config, [result[1] for result in results], [result[2] for result in results])
+            rows = [(FileName, reward_mean, reward_std, username, model_score)
+                    for (FileName, reward_mean, reward_std), model_score in zip(results, scores)]
+            if not rows:
+                return
 
-            # Calculate ModelScore
-            model_score = self.calculate_model_score(reward_mean, reward_std, mean_weight, std_weight)
-        
-            # Insert data into the database
-            self.db_handler.InsertModel(FileName, reward_mean, reward_std, username ,model_score)
-            logging.info(f"Inserted model with score {model_score} for user {username}.")
+            # Queue the results for the batch writer, or insert them directly
+            if self.result_writer:
+                for row in rows:
+                    self.result_writer.submit(*row)
+                logging.info(f"Queued {len(rows)} models for user {username}.")
+            else:
+                if len(rows) == 1:
+                    self.db_handler.InsertModel(*rows[0])
+                else:
+                    self.db_handler.InsertModels(rows)
+                logging.info(f"Inserted {len(rows)} models for user {username}.")
+                for callback in self.result_listeners:
+                    callback()
         except ValueError:
             raise ValueError("Invalid message format. Expected 'data|data|data..'.")
         except Exception as e:
             logging.error(f"An error occurred: {e}")
 
-    def calculate_model_score(self, reward_mean, reward_std, mean_weight=1.0, std_weight=1.0):
-        """
-        Calculate the ModelScore based on reward mean, reward standard deviation, 
-        and their respective weights.
-
-        Parameters:
-            reward_mean (float): The mean reward of the model.
-            reward_std (float): The standard deviation of the rewards.
-            mean_weight (float): Weight multiplier for the reward mean.
-            std_weight (float): Weight multiplier for the reward standard deviation.
-
-        Returns:
-            float: The calculated ModelScore.
-        """
-        model_score = (reward_mean * mean_weight) - (reward_std * std_weight)
-        return model_score
-
-
-    
     def handle_started(self, data, username):
         """Handle the 'started training' command."""
         logging.info(f"Processing started for user {username}, with data {data}")
@@ -185,13 +290,12 @@ class MQTTHandler:
         logging.info(f"processing newUser with username {data}")
         self.db_handler.InsertUser(data)
         logging.info(f"inserted user with username {data}")
-        dotenvFile = dotenv.find_dotenv()
-        dotenv.load_dotenv(dotenvFile, override=True)
-        seed= os.getenv("SEED")
-        testseed= os.getenv("TestSED")
-        maxietarions= os.getenv("MaxIterations")
-        testiterations= os.getenv("TestMaxIterations")
-        filepath= os.getenv("BestFilePath")
+        config = self.config.snapshot()
+        seed= config.get("SEED")
+        testseed= config.get("TestSED")
+        maxietarions= config.get("MaxIterations")
+        testiterations= config.get("TestMaxIterations")
+        filepath= config.get("BestFilePath")
         payload=f"Setup|{maxietarions}|{seed}|{testiterations}|{testseed}|{filepath}"
         topic=f"{data}/Commands"
         self.send_message(topic, payload)
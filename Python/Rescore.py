@@ -0,0 +1,175 @@
+import threading
+import time
+import logging
+
+# NumPy is optional and not a declared dependency; without it scoring falls back to plain Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Config keys the scores depend on; a change to any of them triggers a rescore
+SCORE_KEYS = ("ScoreFormula", "meanWeight", "stdWeight", "ScoreLCBZ", "TestMaxIterations")
+
+
+def mean_std(mean, std, config):
+    """The original score: meanWeight * mean - stdWeight * std."""
+    return mean * float(config.get("meanWeight", 1)) - std * float(config.get("stdWeight", 1))
+
+
+def lcb(mean, std, config):
+    """
+    Lower confidence bound of the mean reward over TestMaxIterations test episodes:
+    mean - ScoreLCBZ * std / sqrt(episodes).
+    """
+    episodes = max(1.0, float(config.get("TestMaxIterations") or 1))
+    return mean - float(config.get("ScoreLCBZ", 1.96)) * std / episodes ** 0.5
+
+
+# Formulas only use arithmetic, so they work on floats and NumPy arrays alike
+FORMULAS = {
+    "mean_std": mean_std,
+    "lcb": lcb,
+}
+
+
+def register_formula(name, formula):
+    """Add a scoring formula(mean, std, config), selectable with ScoreFormula=name."""
+    FORMULAS[name] = formula
+
+
+_reported_formulas = set()
+
+
+def get_formula(config):
+    """
+    Return the formula selected by ScoreFormula in a config snapshot.
+    An unknown name falls back to mean_std, so a typo in .env never stops results from being scored.
+    """
+    name = config.get("ScoreFormula", "mean_std")
+    if name not in FORMULAS:
+        if name not in _reported_formulas:
+            _reported_formulas.add(name)
+            logging.error(f"Unknown score formula '{name}', scoring with 'mean_std' until ScoreFormula is fixed.")
+        return mean_std
+    return FORMULAS[name]
+
+
+def score(config, mean, std):
+    """Score a single result with the configured formula."""
+    return float(get_formula(config)(float(mean), float(std), config))
+
+
+def score_many(config, means, stds):
+    """Score lists of results, vectorized with NumPy when it is installed."""
+    formula = get_formula(config)
+    if np is not None:
+        return formula(np.asarray(means, dtype=np.float64), np.asarray(stds, dtype=np.float64), config).tolist()
+    return [float(formula(float(mean), float(std), config)) for mean, std in zip(means, stds)]
+
+
+class Rescorer:
+    def __init__(self, db_handler, config, chunk_size=5000, settle=5):
+        """
+        Recompute ModelScore of every stored result when the scoring config changes.
+        :param db_handler: The database handler class.
+        :param config: Shared Config the formula and weights are read from.
+        :param chunk_size: Rows read, scored and written back per step.
+        :param settle: Seconds to wait after the walk before rescoring rows written since, which may have
+                       been scored with the old settings while they waited in the ResultWriter queue.
+        """
+        self.db_handler = db_handler
+        self.config = config
+        self.chunk_size = int(chunk_size)
+        self.settle = float(settle)
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.running = False
+        self.rerun = False
+
+    def add_listener(self, callback):
+        """Register a callback that is called without arguments after every rescore."""
+        self.listeners.append(callback)
+
+    def on_config_change(self, old, new):
+        """Config listener starting a background rescore when a score setting changed."""
+        if any(old.get(key) != new.get(key) for key in SCORE_KEYS):
+            logging.info("Score settings changed, rescoring stored models.")
+            self.rescore_async()
+
+    def rescore_async(self):
+        """Rescore on a background thread; a request during a running rescore runs it again afterwards."""
+        with self.lock:
+            if self.running:
+                self.rerun = True
+                return
+            self.running = True
+        threading.Thread(target=self._run, name="Rescorer", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.rescore()
+            except Exception as e:
+                logging.error(f"Error rescoring models: {e}")
+            with self.lock:
+                if not self.rerun:
+                    self.running = False
+                    return
+                self.rerun = False
+
+    def rescore(self):
+        """
+        Recompute the scores of all rows in Models, ModelsArchive and LatestModels with the current config.
+        Rows are walked in id order until none are left, so results written meanwhile are included.
+        Models goes first, so rows archived during the rescore are picked up from the archive, and after
+        settle seconds the Models rows written since the walk are rescored as well.
+        :return: The number of rows rescored.
+        """
+        config = self.config.snapshot()
+        started = time.monotonic()
+        logging.info(f"Rescoring with {'NumPy' if np is not None else 'plain Python, NumPy is not installed'}")
+        total, last_id = self._rescore_after(config, "Models", 0)
+        total += self._rescore_after(config, "ModelsArchive", 0)[0]
+        if self.settle > 0:
+            # Results queued before the config reload arrive shortly after the walk; pick them up too
+            time.sleep(self.settle)
+            total += self._rescore_after(config, "Models", last_id)[0]
+        self.db_handler.refresh_latest_scores()
+        logging.info(f"Rescored {total} models with '{config.get('ScoreFormula', 'mean_std')}' in {time.monotonic() - started:.1f}s")
+        for callback in self.listeners:
+            callback()
+        return total
+
+    def _rescore_after(self, config, table, after_id):
+        """
+        Rescore the rows of table with an id above after_id, chunk by chunk until none are left.
+        :return: The number of rows rescored and the last id seen.
+        """
+        total = 0
+        while True:
+            rows = self.db_handler.fetch_rewards(after_id, self.chunk_size, table=table)
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            scores = score_many(config, [row[1] for row in rows], [row[2] for row in rows])
+            self.db_handler.update_scores(list(zip(ids, scores)), table=table)
+            total += len(rows)
+            after_id = ids[-1]
+        return total, after_id
+
+if __name__ == "__main__":
+    # Rescore on demand, using the same .env settings as Main.py
+    from Config import Config
+    from SQLHandler import SQLHandler
+    logging.basicConfig(level=logging.INFO)
+    config = Config()
+    sql_handler = SQLHandler(
+        host=config.get("SQLHOST"),
+        user=config.get("DBUSER"),
+        password=config.get("DBPASSWORD"),
+        database=config.get("DBDB")
+    )
+    # Run by hand with the server stopped, so there is nothing in flight to wait for
+    Rescorer(sql_handler, config, chunk_size=config.get("RescoreChunkSize", 5000), settle=0).rescore()
+    sql_handler.close()
@@ -0,0 +1,174 @@
+import queue
+import threading
+import time
+import logging
+
+_STOP = object()
+
+class ResultWriter:
+    def __init__(self, db_handler, batch_size=200, flush_interval=0.5, max_queue=10000, put_timeout=5):
+        """
+        Initialize the write-behind result writer.
+        :param db_handler: The database handler class.
+        :param batch_size: Flush a batch once it holds this many results.
+        :param flush_interval: Flush a partial batch after this many seconds.
+        :param max_queue: Maximum number of results waiting to be written.
+        :param put_timeout: Seconds a producer blocks on a full queue before the result is dropped.
+        """
+        self.db_handler = db_handler
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.put_timeout = float(put_timeout)
+        self.queue = queue.Queue(maxsize=int(max_queue))
+        self.running = False
+        # Held while checking running and queueing, so no result can land behind _STOP
+        self.submit_lock = threading.Lock()
+        self.thread = None
+        self.listeners = []
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            "enqueued": 0,
+            "dropped": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "last_batch_latency": 0.0,
+            "max_batch_latency": 0.0,
+            "total_batch_latency": 0.0,
+        }
+
+    def add_listener(self, callback):
+        """Register a callback that is called without arguments after every written batch."""
+        self.listeners.append(callback)
+
+    def start(self):
+        """Start the writer thread."""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="ResultWriter", daemon=True)
+        self.thread.start()
+        logging.info("ResultWriter started.")
+
+    def stop(self):
+        """Stop the writer thread after flushing everything still queued."""
+        with self.submit_lock:
+            if not self.running:
+                return
+            self.running = False
+        self.queue.put(_STOP)
+        self.thread.join()
+        logging.info("ResultWriter stopped.")
+
+    def submit(self, filename, reward_mean, reward_std, username, model_score):
+        """
+        Queue a result for the next batch.
+        Blocks for up to put_timeout seconds when the queue is full.
+        :return: True if the result was queued, False if it was dropped.
+        """
+        item = (filename, reward_mean, reward_std, username, model_score)
+        deadline = time.monotonic() + self.put_timeout
+        while True:
+            with self.submit_lock:
+                if not self.running:
+                    logging.error(f"ResultWriter is not running, dropping result '{filename}' for user '{username}'.")
+                    self._count("dropped")
+                    return False
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    pass
+            # Wait outside the lock, so stop() is never held up by a full queue
+            if time.monotonic() >= deadline:
+                logging.error(f"Result queue is full, dropping result '{filename}' for user '{username}'.")
+                self._count("dropped")
+                return False
+            time.sleep(0.01)
+        self._count("enqueued")
+        return True
+
+    def run(self):
+        """Drain the queue and write results in batches."""
+        stopping = False
+        while not stopping:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.write_batch(batch)
+
+    def write_batch(self, batch):
+        """
+        Write one batch to the database, retrying once on failure.
+        If the batch still fails, its rows are written one by one so a single bad row only loses itself.
+        """
+        started = time.monotonic()
+        for attempt in (1, 2):
+            try:
+                # Rows of unknown users are skipped, so count what was actually inserted
+                written = self.db_handler.InsertModels(batch) or 0
+                break
+            except Exception as e:
+                logging.error(f"Failed to write batch of {len(batch)} results (attempt {attempt}): {e}")
+        else:
+            written = self.write_rows(batch)
+        if not written:
+            return
+        latency = time.monotonic() - started
+
+        with self.stats_lock:
+            self.counters["written"] += written
+            self.counters["batches"] += 1
+            self.counters["last_batch_size"] = written
+            self.counters["last_batch_latency"] = latency
+            self.counters["total_batch_latency"] += latency
+            self.counters["max_batch_latency"] = max(self.counters["max_batch_latency"], latency)
+        logging.info(f"Wrote batch of {written} results in {latency * 1000:.1f} ms.")
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Result listener failed: {e}")
+
+    def write_rows(self, batch):
+        """
+        Write the rows of a failed batch one at a time.
+        :return: The number of rows written.
+        """
+        written = 0
+        for row in batch:
+            try:
+                written += self.db_handler.InsertModels([row]) or 0
+            except Exception as e:
+                logging.error(f"Dropping result '{row[0]}' for user '{row[3]}': {e}")
+                self._count("failed")
+        return written
+
+    def stats(self):
+        """Return a snapshot of the writer counters, including the current queue depth."""
+        with self.stats_lock:
+            stats = dict(self.counters)
+        stats["queue_depth"] = self.queue.qsize()
+        stats["avg_batch_latency"] = stats["total_batch_latency"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _count(self, name, amount=1):
+        with self.stats_lock:
+            self.counters[name] += amount
@@ -0,0 +1,110 @@
+import time
+import threading
+import logging
+
+class Retention:
+    def __init__(self, db_handler, keep_per_user=0, max_age_days=0, batch_size=1000, interval=300, pause=0.5):
+        """
+        Keep the Models table small by moving old rows to ModelsArchive in the background.
+        Rows are moved in batches, each its own short transaction, with a pause in between so
+        inserts of new results are never held up for long.
+        :param db_handler: The database handler class.
+        :param keep_per_user: Newest rows to keep per user, 0 to not limit by count.
+        :param max_age_days: Days to keep rows, 0 to not limit by age.
+        :param batch_size: Rows moved per batch.
+        :param interval: Seconds between runs once the table is within the limits.
+        :param pause: Seconds between batches of one run.
+        """
+        self.db_handler = db_handler
+        self.keep_per_user = int(keep_per_user)
+        self.max_age_days = int(max_age_days)
+        self.batch_size = int(batch_size)
+        self.interval = float(interval)
+        self.pause = float(pause)
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def enabled(self):
+        """Return True if any retention limit is configured."""
+        return self.keep_per_user > 0 or self.max_age_days > 0
+
+    def start(self):
+        """Start the retention thread."""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="Retention", daemon=True)
+        self.thread.start()
+        logging.info(f"Retention started, keeping {self.keep_per_user or 'all'} models per user and {self.max_age_days or 'unlimited'} days.")
+
+    def stop(self):
+        """Stop the retention thread after the current batch."""
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+        logging.info("Retention stopped.")
+
+    def run(self):
+        while self.running:
+            self.run_once()
+            self.wakeup.wait(self.interval)
+
+    def run_once(self):
+        """
+        Archive batches until nothing is left to move or the thread is stopped.
+        The per-user cutoffs are looked up once at the start of the run, then each user is paged through.
+        :return: The number of rows moved.
+        """
+        moved = 0
+        started = time.monotonic()
+        if self.max_age_days > 0:
+            moved += self._drain(self.db_handler.archive_models_older_than, self.max_age_days)
+        if self.keep_per_user > 0 and self._active():
+            for userid, cutoff_at, cutoff_id in self.db_handler.retention_cutoffs(self.keep_per_user):
+                if not self._active():
+                    break
+                moved += self._drain(self.db_handler.archive_models_before, userid, cutoff_at, cutoff_id)
+        if moved:
+            logging.info(f"Archived {moved} models in {time.monotonic() - started:.1f}s")
+        return moved
+
+    def _active(self):
+        # Without a thread, run_once is a one-off call that runs until done
+        return self.running or self.thread is None
+
+    def _drain(self, archive, *args):
+        """Call archive(*args, batch_size) until a batch comes back short, pausing in between."""
+        moved = 0
+        while self._active():
+            count = archive(*args, batch_size=self.batch_size)
+            moved += count
+            if count < self.batch_size:
+                break
+            if self.wakeup.wait(self.pause):
+                break
+        return moved
+
+if __name__ == "__main__":
+    # One-off archive run using the same .env settings as Main.py
+    import os
+    import dotenv
+    from SQLHandler import SQLHandler
+    logging.basicConfig(level=logging.INFO)
+    dotenv.load_dotenv(dotenv.find_dotenv())
+    sql_handler = SQLHandler(
+        host=os.getenv("SQLHOST"),
+        user=os.getenv("DBUSER"),
+        password=os.getenv("DBPASSWORD"),
+        database=os.getenv("DBDB")
+    )
+    retention = Retention(
+        sql_handler,
+        keep_per_user=os.getenv("RetentionKeepPerUser", 0),
+        max_age_days=os.getenv("RetentionMaxAgeDays", 0),
+        batch_size=os.getenv("RetentionBatchSize", 1000)
+    )
+    if retention.enabled():
+        retention.run_once()
+    else:
+        logging.info("Set RetentionKeepPerUser or RetentionMaxAgeDays to archive models.")
+    sql_handler.close()
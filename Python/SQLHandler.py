@@ -1,37 +1,54 @@
 import mysql.connector
 from mysql.connector import errorcode
+from contextlib import contextmanager
+from collections import OrderedDict
+import threading
+import queue
+import time
 import logging
+from Metrics import timed_db
 
 class SQLHandler:
-    def __init__(self, host, user, password, database):
+    def __init__(self, host, user, password, database, pool_size=1, stale_after=60, checkout_timeout=30, user_cache_size=1024):
         """
         Initialize the SQL handler.
         :param host: Database host (e.g., 'localhost' or a docker container IP).
         :param user: Database user (e.g., 'root').
         :param password: Database password.
         :param database: Database name.
+        :param pool_size: Number of pooled connections shared by all threads.
+        :param stale_after: Seconds a connection may sit idle before it is pinged on checkout.
+        :param checkout_timeout: Seconds to wait for a free connection before giving up.
+        :param user_cache_size: Maximum number of username to USERID mappings kept in memory.
         """
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.connection = None
-        self.cursor = None
+        self.pool_size = max(1, int(pool_size))
+        self.stale_after = float(stale_after)
+        self.checkout_timeout = float(checkout_timeout)
+        self.pool = queue.LifoQueue()
+        self.pool_lock = threading.Lock()
+        self.opened = 0
+        self.user_cache = OrderedDict()
+        self.user_cache_size = int(user_cache_size)
+        self.user_cache_lock = threading.Lock()
+        self.user_cache_hits = 0
+        self.user_cache_misses = 0
+        self.auto_increment_step = None
 
         self.connect()
 
     def connect(self):
         """Connect to the MySQL database."""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-            self.cursor = self.connection.cursor()
-            logging.info("Connected to the database successfully.")
+            with self._cursor():
+                pass
+            logging.info(f"Connected to the database successfully (pool size {self.pool_size}).")
             self.setup_schema()
+            self.apply_migrations()
+            self.warm_user_cache()
         except mysql.connector.Error as err:
             if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
                 logging.info("Invalid username or password.")
@@ -40,70 +57,679 @@ class SQLHandler:
             else:
                 logging.error(err)
 
+    def _open_connection(self):
+        """Open a new connection to the MySQL database."""
+        return mysql.connector.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database
+        )
+
+    def _checkout(self):
+        """Take a connection from the pool, opening a new one while the pool is below its size."""
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self.pool_lock:
+            if self.opened < self.pool_size:
+                connection = self._open_connection()
+                self.opened += 1
+                return connection, time.monotonic()
+        try:
+            return self.pool.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise mysql.connector.errors.PoolError("Timed out waiting for a pooled database connection.")
+
+    def _reconnect(self, connection):
+        """Try to re-establish a dropped connection before it goes back into the pool."""
+        try:
+            connection.reconnect(attempts=3, delay=1)
+            logging.info("Reconnected to the database.")
+        except mysql.connector.Error as err:
+            logging.error(f"Error reconnecting to the database: {err}")
+
+    @contextmanager
+    def _cursor(self):
+        """
+        Check out a pooled connection and yield it together with its own cursor.
+        Connections idle longer than stale_after are pinged first, dropped connections are
+        reconnected and failed transactions are rolled back before the connection is returned.
+        """
+        connection, last_used = self._checkout()
+        try:
+            if time.monotonic() - last_used > self.stale_after:
+                connection.ping(reconnect=True, attempts=3, delay=1)
+            cursor = connection.cursor(buffered=True)
+            try:
+                yield connection, cursor
+            finally:
+                cursor.close()
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            self._reconnect(connection)
+            raise
+        except Exception:
+            try:
+                connection.rollback()
+            except mysql.connector.Error:
+                self._reconnect(connection)
+            raise
+        finally:
+            self.pool.put((connection, time.monotonic()))
+
+    def _cache_get(self, username):
+        """Return the cached USERID for a username, or None on a miss."""
+        with self.user_cache_lock:
+            userid = self.user_cache.get(username)
+            if userid is None:
+                self.user_cache_misses += 1
+                return None
+            self.user_cache.move_to_end(username)
+            self.user_cache_hits += 1
+            return userid
+
+    def _cache_put(self, username, userid):
+        """Store a username to USERID mapping, evicting the least recently used entry when full."""
+        if self.user_cache_size <= 0:
+            return
+        with self.user_cache_lock:
+            self.user_cache[username] = userid
+            self.user_cache.move_to_end(username)
+            while len(self.user_cache) > self.user_cache_size:
+                self.user_cache.popitem(last=False)
+
+    def _get_user_id(self, cursor, username):
+        """Resolve a username to its USERID, using the cache before querying the database."""
+        userid = self._cache_get(username)
+        if userid is not None:
+            return userid
+        find_user_query = "SELECT id FROM Users WHERE Username = %s"
+        cursor.execute(find_user_query, (username,))
+        result = cursor.fetchone()
+        if result is None:
+            return None
+        self._cache_put(username, result[0])
+        return result[0]
+
+    def warm_user_cache(self):
+        """Load the most recent users into the USERID cache."""
+        if self.user_cache_size <= 0:
+            return
+        try:
+            with self._cursor() as (connection, cursor):
+                cursor.execute("SELECT id, Username FROM Users ORDER BY id DESC LIMIT %s", (self.user_cache_size,))
+                results = cursor.fetchall()
+            for userid, username in reversed(results):
+                self._cache_put(username, userid)
+            logging.info(f"Warmed user cache with {len(results)} users.")
+        except mysql.connector.Error as err:
+            logging.error(f"Error warming user cache: {err}")
+
+    def invalidate_user_cache(self, username=None):
+        """
+        Drop cached USERIDs.
+        :param username: Only drop this username, or everything when None.
+        """
+        with self.user_cache_lock:
+            if username is None:
+                self.user_cache.clear()
+            else:
+                self.user_cache.pop(username, None)
+
+    def user_cache_stats(self):
+        """Return the size and hit/miss counters of the USERID cache."""
+        with self.user_cache_lock:
+            return {
+                "size": len(self.user_cache),
+                "capacity": self.user_cache_size,
+                "hits": self.user_cache_hits,
+                "misses": self.user_cache_misses,
+            }
+
     def setup_schema(self):
         """Create the necessary tables if they do not exist."""
         try:
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS Users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                Username VARCHAR(255) NOT NULL,
-                CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """
-            self.cursor.execute(create_table_query)
-            self.connection.commit()
-
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS Models (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                FileName VARCHAR(255) NOT NULL,
-                rewardMean DOUBLE NOT NULL,
-                rewardStd DOUBLE NOT NULL,
-                ModelScore DOUBLE NOT NULL,
-                USERID INT NOT NULL,
-                uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (USERID) REFERENCES Users(id)
-            );
-            """
-            self.cursor.execute(create_table_query)
-            self.connection.commit()
+            with self._cursor() as (connection, cursor):
+                create_table_query = """
+                CREATE TABLE IF NOT EXISTS Users (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    Username VARCHAR(255) NOT NULL,
+                    CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                """
+                cursor.execute(create_table_query)
+                connection.commit()
+
+                create_table_query = """
+                CREATE TABLE IF NOT EXISTS Models (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    FileName VARCHAR(255) NOT NULL,
+                    rewardMean DOUBLE NOT NULL,
+                    rewardStd DOUBLE NOT NULL,
+                    ModelScore DOUBLE NOT NULL,
+                    USERID INT NOT NULL,
+                    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (USERID) REFERENCES Users(id)
+                );
+                """
+                cursor.execute(create_table_query)
+                connection.commit()
+
+                # Newest model per user, maintained on every insert so Compare reads O(users) rows
+                create_table_query = """
+                CREATE TABLE IF NOT EXISTS LatestModels (
+                    USERID INT PRIMARY KEY,
+                    MODELID INT NOT NULL,
+                    FileName VARCHAR(255) NOT NULL,
+                    rewardMean DOUBLE NOT NULL,
+                    rewardStd DOUBLE NOT NULL,
+                    ModelScore DOUBLE NOT NULL,
+                    uploaded_at TIMESTAMP NULL DEFAULT NULL,
+                    FOREIGN KEY (USERID) REFERENCES Users(id)
+                );
+                """
+                cursor.execute(create_table_query)
+                connection.commit()
+
+                cursor.execute("SELECT 1 FROM LatestModels LIMIT 1")
+                needs_backfill = cursor.fetchone() is None
 
             logging.info("Database schema is set up.")
+            if needs_backfill:
+                self.rebuild_latest_models()
         except mysql.connector.Error as err:
             logging.error(f"Error creating schema: {err}")
 
+    def _migrations(self):
+        """
+        Ordered schema migrations as (version, description, function) tuples.
+        Each function receives a cursor and must be safe to run again, since MySQL DDL commits implicitly.
+        """
+        return [
+            (1, "Unique index on Users.Username", lambda cursor: self._ensure_unique_usernames(cursor)),
+            (2, "Index on Models.FileName", lambda cursor: self._ensure_index(cursor, "Models", "idx_models_filename", "FileName")),
+            (3, "Index on Models (USERID, uploaded_at)", lambda cursor: self._ensure_index(cursor, "Models", "idx_models_user_uploaded", "USERID, uploaded_at")),
+            (4, "ModelFiles table with content hashes", lambda cursor: cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ModelFiles (
+                    FileName VARCHAR(255) PRIMARY KEY,
+                    ModelHash CHAR(64) NOT NULL,
+                    Size BIGINT NOT NULL,
+                    StoredAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_modelfiles_hash (ModelHash)
+                );
+            """)),
+            (5, "ExperimentPhases table for phase timings", lambda cursor: cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ExperimentPhases (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    PlanName VARCHAR(255) NOT NULL,
+                    PhaseIndex INT NOT NULL,
+                    PhaseName VARCHAR(255) NOT NULL,
+                    StartedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    EndedAt TIMESTAMP NULL DEFAULT NULL,
+                    ResultsReceived INT NULL,
+                    INDEX idx_phases_plan (PlanName, PhaseIndex)
+                );
+            """)),
+            (6, "ModelsArchive table for rows moved out of Models", lambda cursor: cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ModelsArchive (
+                    id INT PRIMARY KEY,
+                    FileName VARCHAR(255) NOT NULL,
+                    rewardMean DOUBLE NOT NULL,
+                    rewardStd DOUBLE NOT NULL,
+                    ModelScore DOUBLE NOT NULL,
+                    USERID INT NOT NULL,
+                    uploaded_at TIMESTAMP NULL DEFAULT NULL,
+                    ArchivedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_archive_filename (FileName),
+                    INDEX idx_archive_user_uploaded (USERID, uploaded_at)
+                );
+            """)),
+            (7, "Indexes on uploaded_at for retention and phase counts", lambda cursor: (
+                self._ensure_index(cursor, "Models", "idx_models_uploaded", "uploaded_at, id"),
+                self._ensure_index(cursor, "ModelsArchive", "idx_archive_uploaded", "uploaded_at"),
+            )),
+        ]
+
+    def apply_migrations(self):
+        """Apply every migration newer than the version recorded in schema_version."""
+        try:
+            with self._cursor() as (connection, cursor):
+                create_table_query = """
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                """
+                cursor.execute(create_table_query)
+                connection.commit()
+
+                cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                current_version = cursor.fetchone()[0]
+
+                for version, description, migrate in self._migrations():
+                    if version <= current_version:
+                        continue
+                    logging.info(f"Applying migration {version}: {description}")
+                    migrate(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (version, description)
+                    )
+                    connection.commit()
+                    current_version = version
+            logging.info(f"Database schema is at version {current_version}.")
+        except mysql.connector.Error as err:
+            logging.error(f"Error applying migrations: {err}")
+
+    def _ensure_index(self, cursor, table, index, columns, unique=False):
+        """Create an index unless one with the same name already exists."""
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (table, index)
+        )
+        if cursor.fetchone():
+            return
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        cursor.execute(f"CREATE {kind} {index} ON {table} ({columns})")
+
+    def _ensure_unique_usernames(self, cursor):
+        """
+        Add the unique Username index, first merging duplicate usernames the old InsertUser could create.
+        Each duplicate keeps its lowest id; the Models rows of the other ids are moved to it.
+        Otherwise this migration would fail and hold back every later one.
+        """
+        cursor.execute("SELECT Username, MIN(id) FROM Users GROUP BY Username HAVING COUNT(*) > 1")
+        for username, keep_id in cursor.fetchall():
+            cursor.execute("SELECT id FROM Users WHERE Username = %s AND id <> %s", (username, keep_id))
+            duplicate_ids = [row[0] for row in cursor.fetchall()]
+            placeholders = ", ".join(["%s"] * len(duplicate_ids))
+            cursor.execute(f"UPDATE Models SET USERID = %s WHERE USERID IN ({placeholders})", [keep_id] + duplicate_ids)
+            cursor.execute(f"DELETE FROM LatestModels WHERE USERID IN ({placeholders})", duplicate_ids)
+            cursor.execute(f"DELETE FROM Users WHERE id IN ({placeholders})", duplicate_ids)
+            self._refresh_latest_models(cursor, [keep_id])
+            logging.info(f"Merged {len(duplicate_ids)} duplicate users named '{username}' into id {keep_id}.")
+        self._ensure_index(cursor, "Users", "idx_users_username", "Username", unique=True)
+
+    @timed_db
     def InsertModel(self, filename, rewardMean, rewardStd, username, modelScore):
         """Insert a new Model record into the database using the username to find the USERID."""
         try:
-            # Find the USERID based on the username
-            find_user_query = "SELECT id FROM Users WHERE Username = %s"
-            self.cursor.execute(find_user_query, (username,))
-            result = self.cursor.fetchone()
-            
-            if result is None:
-                logging.info(f"Error: No user found with username '{username}'.")
-                return
-            
-            userid = result[0]  # Extract USERID from the query result
-            
-            # Insert the new file record into the Models table
-            insert_query = """
-            INSERT INTO Models (FileName, rewardMean, rewardStd, USERID, ModelScore) 
-            VALUES (%s, %s, %s, %s, %s)
-            """
-            self.cursor.execute(insert_query, (filename, rewardMean, rewardStd, userid, modelScore,))
-            self.connection.commit()
+            with self._cursor() as (connection, cursor):
+                # Find the USERID based on the username
+                userid = self._get_user_id(cursor, username)
+
+                if userid is None:
+                    logging.info(f"Error: No user found with username '{username}'.")
+                    return
+
+                # Insert the new file record into the Models table
+                insert_query = """
+                INSERT INTO Models (FileName, rewardMean, rewardStd, USERID, ModelScore)
+                VALUES (%s, %s, %s, %s, %s)
+                """
+                cursor.execute(insert_query, (filename, rewardMean, rewardStd, userid, modelScore,))
+                self._upsert_latest_models(cursor, [cursor.lastrowid])
+                connection.commit()
             logging.info(f"Inserted new file '{filename}' into the database for user '{username}'.")
         except mysql.connector.Error as err:
             logging.error(f"Error inserting data: {err}")
             raise
 
+    @timed_db
+    def InsertModels(self, rows):
+        """
+        Insert many Model records with a single multi-row INSERT and one commit.
+        :param rows: List of (filename, rewardMean, rewardStd, username, modelScore) tuples.
+        :return: The number of rows inserted.
+        """
+        if not rows:
+            return 0
+        try:
+            with self._cursor() as (connection, cursor):
+                userids = {}
+                missing = []
+                for username in {row[3] for row in rows}:
+                    userid = self._cache_get(username)
+                    if userid is None:
+                        missing.append(username)
+                    else:
+                        userids[username] = userid
+                if missing:
+                    placeholders = ", ".join(["%s"] * len(missing))
+                    find_users_query = f"SELECT id, Username FROM Users WHERE Username IN ({placeholders})"
+                    cursor.execute(find_users_query, missing)
+                    for userid, username in cursor.fetchall():
+                        userids[username] = userid
+                        self._cache_put(username, userid)
+
+                values = []
+                for filename, rewardMean, rewardStd, username, modelScore in rows:
+                    userid = userids.get(username)
+                    if userid is None:
+                        logging.info(f"Error: No user found with username '{username}', skipping '{filename}'.")
+                        continue
+                    values.append((filename, rewardMean, rewardStd, userid, modelScore))
+                if not values:
+                    return 0
+
+                insert_query = (
+                    "INSERT INTO Models (FileName, rewardMean, rewardStd, USERID, ModelScore) VALUES "
+                    + ", ".join(["(%s, %s, %s, %s, %s)"] * len(values))
+                )
+                cursor.execute(insert_query, [value for row in values for value in row])
+                # A multi-row INSERT with a known row count gets one block of ids starting at lastrowid
+                step = self._auto_increment_step(cursor)
+                newest = {}
+                for offset, row in enumerate(values):
+                    newest[row[3]] = cursor.lastrowid + offset * step
+                self._upsert_latest_models(cursor, list(newest.values()))
+                connection.commit()
+            logging.info(f"Inserted {len(values)} models into the database.")
+            return len(values)
+        except mysql.connector.Error as err:
+            logging.error(f"Error inserting data: {err}")
+            raise
+
+    def _auto_increment_step(self, cursor):
+        """Return the server's auto_increment_increment, read once."""
+        if self.auto_increment_step is None:
+            cursor.execute("SELECT @@auto_increment_increment")
+            self.auto_increment_step = int(cursor.fetchone()[0])
+        return self.auto_increment_step
+
+    def _upsert_latest_models(self, cursor, model_ids):
+        """
+        Point LatestModels at Models rows just inserted, looked up by primary key.
+        Every column only moves forward to a higher MODELID, so concurrent writers cannot leave an older row behind.
+        :param cursor: Cursor of the transaction the Models rows were inserted in.
+        :param model_ids: Ids of the new rows, at most one per user.
+        """
+        placeholders = ", ".join(["%s"] * len(model_ids))
+        # MODELID is assigned last, since the other columns compare against its old value
+        upsert_query = f"""
+        INSERT INTO LatestModels (USERID, MODELID, FileName, rewardMean, rewardStd, ModelScore, uploaded_at)
+        SELECT USERID, id, FileName, rewardMean, rewardStd, ModelScore, uploaded_at
+        FROM Models WHERE id IN ({placeholders})
+        ON DUPLICATE KEY UPDATE
+            FileName = IF(VALUES(MODELID) > MODELID, VALUES(FileName), FileName),
+            rewardMean = IF(VALUES(MODELID) > MODELID, VALUES(rewardMean), rewardMean),
+            rewardStd = IF(VALUES(MODELID) > MODELID, VALUES(rewardStd), rewardStd),
+            ModelScore = IF(VALUES(MODELID) > MODELID, VALUES(ModelScore), ModelScore),
+            uploaded_at = IF(VALUES(MODELID) > MODELID, VALUES(uploaded_at), uploaded_at),
+            MODELID = IF(VALUES(MODELID) > MODELID, VALUES(MODELID), MODELID)
+        """
+        cursor.execute(upsert_query, tuple(model_ids))
+
+    def _refresh_latest_models(self, cursor, userids=None):
+        """
+        Upsert the newest Models row of each user into LatestModels by scanning Models.
+        Used by migrations and rebuilds; inserts use _upsert_latest_models instead.
+        :param cursor: Cursor of the transaction the Models rows were inserted in.
+        :param userids: USERIDs to refresh, or None to refresh every user.
+        """
+        where = ""
+        params = ()
+        if userids is not None:
+            where = "WHERE USERID IN (" + ", ".join(["%s"] * len(userids)) + ")"
+            params = tuple(userids)
+        upsert_query = f"""
+        INSERT INTO LatestModels (USERID, MODELID, FileName, rewardMean, rewardStd, ModelScore, uploaded_at)
+        SELECT m.USERID, m.id, m.FileName, m.rewardMean, m.rewardStd, m.ModelScore, m.uploaded_at
+        FROM Models m
+        JOIN (SELECT USERID, MAX(id) AS id FROM Models {where} GROUP BY USERID) newest ON newest.id = m.id
+        ON DUPLICATE KEY UPDATE
+            MODELID = VALUES(MODELID),
+            FileName = VALUES(FileName),
+            rewardMean = VALUES(rewardMean),
+            rewardStd = VALUES(rewardStd),
+            ModelScore = VALUES(ModelScore),
+            uploaded_at = VALUES(uploaded_at)
+        """
+        cursor.execute(upsert_query, params)
+
+    @timed_db
+    def rebuild_latest_models(self):
+        """Backfill LatestModels from the full Models table."""
+        try:
+            with self._cursor() as (connection, cursor):
+                self._refresh_latest_models(cursor)
+                connection.commit()
+            logging.info("Rebuilt LatestModels from the Models table.")
+        except mysql.connector.Error as err:
+            logging.error(f"Error rebuilding LatestModels: {err}")
+
+    @timed_db
+    def archive_models_older_than(self, max_age_days, batch_size=1000):
+        """
+        Move one batch of Models rows older than max_age_days to ModelsArchive, oldest first.
+        Rows referenced by LatestModels are always kept. Call repeatedly until it returns less than batch_size.
+        :return: The number of rows moved.
+        """
+        try:
+            with self._cursor() as (connection, cursor):
+                cursor.execute("""
+                SELECT m.id FROM Models m
+                LEFT JOIN LatestModels l ON l.MODELID = m.id
+                WHERE m.uploaded_at < NOW() - INTERVAL %s DAY AND l.MODELID IS NULL
+                ORDER BY m.uploaded_at, m.id
+                LIMIT %s
+                """, (int(max_age_days), int(batch_size)))
+                return self._archive_ids(connection, cursor, [row[0] for row in cursor.fetchall()])
+        except mysql.connector.Error as err:
+            logging.error(f"Error archiving models older than {max_age_days} days: {err}")
+            return 0
+
+    @timed_db
+    def retention_cutoffs(self, keep_per_user):
+        """
+        Find, for every user with more than keep_per_user rows, the newest row that is no longer kept.
+        MySQL 5.7 has no window functions, so each cutoff is an ORDER BY ... LIMIT 1 OFFSET keep_per_user
+        lookup on idx_models_user_uploaded. Run once per retention pass, not per batch.
+        :return: A list of (USERID, uploaded_at, id) tuples; that row and every older row of the user may be archived.
+        """
+        cutoffs = []
+        try:
+            with self._cursor() as (connection, cursor):
+                cursor.execute(
+                    "SELECT USERID FROM Models GROUP BY USERID HAVING COUNT(*) > %s",
+                    (int(keep_per_user),)
+                )
+                for (userid,) in cursor.fetchall():
+                    cursor.execute("""
+                    SELECT uploaded_at, id FROM Models
+                    WHERE USERID = %s
+                    ORDER BY uploaded_at DESC, id DESC
+                    LIMIT 1 OFFSET %s
+                    """, (userid, int(keep_per_user)))
+                    cutoff = cursor.fetchone()
+                    if cutoff is not None:
+                        cutoffs.append((userid, cutoff[0], cutoff[1]))
+        except mysql.connector.Error as err:
+            logging.error(f"Error finding retention cutoffs: {err}")
+        return cutoffs
+
+    @timed_db
+    def archive_models_before(self, userid, cutoff_at, cutoff_id, batch_size=1000):
+        """
+        Move one batch of a user's Models rows at or before a cutoff from retention_cutoffs to ModelsArchive.
+        Rows referenced by LatestModels are always kept. Call repeatedly until it returns less than batch_size.
+        :return: The number of rows moved.
+        """
+        try:
+            with self._cursor() as (connection, cursor):
+                cursor.execute("""
+                SELECT m.id FROM Models m
+                LEFT JOIN LatestModels l ON l.MODELID = m.id
+                WHERE m.USERID = %s AND (m.uploaded_at < %s OR (m.uploaded_at = %s AND m.id <= %s))
+                    AND l.MODELID IS NULL
+                ORDER BY m.uploaded_at, m.id
+                LIMIT %s
+                """, (userid, cutoff_at, cutoff_at, cutoff_id, int(batch_size)))
+                return self._archive_ids(connection, cursor, [row[0] for row in cursor.fetchall()])
+        except mysql.connector.Error as err:
+            logging.error(f"Error archiving models of user {userid}: {err}")
+            return 0
+
+    def _archive_ids(self, connection, cursor, ids):
+        """Copy Models rows to ModelsArchive and delete them, in the cursor's transaction."""
+        if not ids:
+            return 0
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"""
+        INSERT IGNORE INTO ModelsArchive (id, FileName, rewardMean, rewardStd, ModelScore, USERID, uploaded_at)
+        SELECT id, FileName, rewardMean, rewardStd, ModelScore, USERID, uploaded_at
+        FROM Models WHERE id IN ({placeholders})
+        """, ids)
+        cursor.execute(f"DELETE FROM Models WHERE id IN ({placeholders})", ids)
+        connection.commit()
+        logging.info(f"Archived {len(ids)} models.")
+        return len(ids)
+
+    @timed_db
+    def fetch_rewards(self, after_id, limit, table="Models"):
+        """
+        Read the rewards of a chunk of Models or ModelsArchive rows, for rescoring.
+        :param table: "Models" or "ModelsArchive".
+        :return: A list of (id, rewardMean, rewardStd) tuples with id > after_id, in id order.
+        """
+        table = self._score_table(table)
+        with self._cursor() as (connection, cursor):
+            cursor.execute(
+                f"SELECT id, rewardMean, rewardStd FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+                (after_id, limit)
+            )
+            return cursor.fetchall()
+
+    @timed_db
+    def update_scores(self, scores, batch_size=1000, table="Models"):
+        """
+        Write new ModelScores back to Models or ModelsArchive.
+        Every batch is one UPDATE joined against the new values, committed on its own.
+        :param scores: A list of (id, ModelScore) tuples.
+        :param table: "Models" or "ModelsArchive".
+        """
+        table = self._score_table(table)
+        for start in range(0, len(scores), batch_size):
+            batch = scores[start:start + batch_size]
+            values = " UNION ALL ".join(["SELECT %s AS id, %s AS score"] * len(batch))
+            update_query = f"""
+            UPDATE {table} m
+            JOIN ({values}) s ON s.id = m.id
+            SET m.ModelScore = s.score
+            """
+            with self._cursor() as (connection, cursor):
+                cursor.execute(update_query, [value for row in batch for value in row])
+                connection.commit()
+
+    def _score_table(self, table):
+        """Check a table name used in rescoring queries, which cannot be passed as a parameter."""
+        if table not in ("Models", "ModelsArchive"):
+            raise ValueError(f"Cannot rescore table '{table}'.")
+        return table
+
+    @timed_db
+    def refresh_latest_scores(self):
+        """Copy the ModelScores of the rows LatestModels points at, after a rescore."""
+        with self._cursor() as (connection, cursor):
+            cursor.execute("""
+            UPDATE LatestModels l
+            JOIN Models m ON m.id = l.MODELID
+            SET l.ModelScore = m.ModelScore
+            """)
+            connection.commit()
+
+    @timed_db
+    def RecordModelFile(self, filename, modelHash, size):
+        """Record the SHA-256 and size of a stored model file, keyed by its file name."""
+        try:
+            with self._cursor() as (connection, cursor):
+                upsert_query = """
+                INSERT INTO ModelFiles (FileName, ModelHash, Size)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE ModelHash = VALUES(ModelHash), Size = VALUES(Size), StoredAt = CURRENT_TIMESTAMP
+                """
+                cursor.execute(upsert_query, (filename, modelHash, size))
+                connection.commit()
+            logging.info(f"Recorded hash {modelHash} for model file '{filename}'.")
+        except mysql.connector.Error as err:
+            logging.error(f"Error recording model file '{filename}': {err}")
+
+    @timed_db
+    def get_model_hash(self, filename):
+        """
+        Return the SHA-256 recorded in ModelFiles for a model file name.
+        :return: The hex digest, or None if the file is unknown or on error.
+        """
+        try:
+            with self._cursor() as (connection, cursor):
+                cursor.execute("SELECT ModelHash FROM ModelFiles WHERE FileName = %s", (filename,))
+                row = cursor.fetchone()
+            return row[0] if row else None
+        except mysql.connector.Error as err:
+            logging.error(f"Error fetching hash of model file '{filename}': {err}")
+            return None
+
+    @timed_db
+    def record_phase_start(self, plan_name, phase_index, phase_name):
+        """
+        Record the start of an experiment phase.
+        :return: The id of the new ExperimentPhases row, or None on error.
+        """
+        try:
+            with self._cursor() as (connection, cursor):
+                insert_query = """
+                INSERT INTO ExperimentPhases (PlanName, PhaseIndex, PhaseName)
+                VALUES (%s, %s, %s)
+                """
+                cursor.execute(insert_query, (plan_name, phase_index, phase_name))
+                connection.commit()
+                return cursor.lastrowid
+        except mysql.connector.Error as err:
+            logging.error(f"Error recording start of phase '{phase_name}': {err}")
+            return None
+
+    @timed_db
+    def record_phase_end(self, phase_id):
+        """Record the end of an experiment phase and how many results arrived during it."""
+        try:
+            with self._cursor() as (connection, cursor):
+                update_query = """
+                UPDATE ExperimentPhases p
+                SET p.EndedAt = NOW(),
+                    p.ResultsReceived = (
+                        SELECT COUNT(*) FROM Models m
+                        WHERE m.uploaded_at >= p.StartedAt AND m.uploaded_at <= NOW()
+                    ) + (
+                        -- Results of long phases may already have been moved by the retention
+                        SELECT COUNT(*) FROM ModelsArchive a
+                        WHERE a.uploaded_at >= p.StartedAt AND a.uploaded_at <= NOW()
+                    )
+                WHERE p.id = %s
+                """
+                cursor.execute(update_query, (phase_id,))
+                connection.commit()
+        except mysql.connector.Error as err:
+            logging.error(f"Error recording end of phase {phase_id}: {err}")
+
+    @timed_db
     def getModel(self, filename):
         """Retrieve a Model record from the database."""
         try:
-            select_query = "SELECT * FROM Models WHERE FileName = %s"
-            self.cursor.execute(select_query, (filename,))
-            result = self.cursor.fetchall()
+            with self._cursor() as (connection, cursor):
+                select_query = "SELECT * FROM Models WHERE FileName = %s"
+                cursor.execute(select_query, (filename,))
+                result = cursor.fetchall()
+                if not result:
+                    # Older results are moved to ModelsArchive by the retention
+                    select_query = """
+                    SELECT id, FileName, rewardMean, rewardStd, ModelScore, USERID, uploaded_at
+                    FROM ModelsArchive WHERE FileName = %s
+                    """
+                    cursor.execute(select_query, (filename,))
+                    result = cursor.fetchall()
             if result:
                 logging.info(f"Found Model: {result}")
                 return result
@@ -113,7 +739,8 @@ class SQLHandler:
         except mysql.connector.Error as err:
             logging.error(f"Error fetching data: {err}")
             return None
-        
+
+    @timed_db
     def get_newest_models(self):
         """
         Retrieve the newest model for each user, along with metadata.
@@ -124,27 +751,25 @@ class SQLHandler:
             query = """
             SELECT 
                 u.Username,
-                m.FileName,
-                m.rewardMean,
-                m.rewardStd,
-                m.ModelScore,
-                m.uploaded_at
+                l.FileName,
+                l.rewardMean,
+                l.rewardStd,
+                l.ModelScore,
+                l.uploaded_at,
+                f.ModelHash
             FROM 
-                Users u
+                LatestModels l
             JOIN 
-                Models m ON u.id = m.USERID
-            WHERE 
-                m.uploaded_at = (
-                    SELECT MAX(m2.uploaded_at) 
-                    FROM Models m2 
-                    WHERE m2.USERID = m.USERID
-                )
+                Users u ON u.id = l.USERID
+            LEFT JOIN
+                ModelFiles f ON f.FileName = l.FileName
             ORDER BY 
                 u.Username;
             """
 
-            self.cursor.execute(query)
-            results = self.cursor.fetchall()
+            with self._cursor() as (connection, cursor):
+                cursor.execute(query)
+                results = cursor.fetchall()
 
             newest_models = [
                 {
@@ -154,6 +779,7 @@ class SQLHandler:
                     "reward_std": row[3],
                     "model_score": row[4],
                     "uploaded_at": row[5],
+                    "model_hash": row[6],
                 }
                 for row in results
             ]   
@@ -162,7 +788,8 @@ class SQLHandler:
         except mysql.connector.Error as err:
             logging.error(f"Error fetching newest models: {err}")
             return []
-        
+
+    @timed_db
     def get_all_users_except(self, excluded_username):
         """
         Retrieve all usernames except for the one specified (e.g., for messaging purposes).
@@ -177,47 +804,50 @@ class SQLHandler:
             WHERE Username != %s
             """
 
-            self.cursor.execute(query, (excluded_username,))
-            results = self.cursor.fetchall()
+            with self._cursor() as (connection, cursor):
+                cursor.execute(query, (excluded_username,))
+                results = cursor.fetchall()
 
             # Extract usernames from the result set
             usernames = [row[0] for row in results]
 
-            logging.info(f"Retrieved all users except {excluded_username}: {usernames}")
+            logging.info(f"Retrieved {len(usernames)} users except {excluded_username}")
+            logging.debug(f"Users except {excluded_username}: {usernames}")
             return usernames
         except mysql.connector.Error as err:
             logging.error(f"Error fetching users excluding {excluded_username}: {err}")
             return []
 
 
+    @timed_db
     def InsertUser(self, username):
         """Insert a new username into the database"""
         try:
-            find_user_query = "SELECT id FROM Users WHERE Username = %s"
-            self.cursor.execute(find_user_query, (username,))
-            result = self.cursor.fetchone()
-            if result is None:
-                logging.info(f"No user found, will insert user with username: '{username}'.")
-                insert_query = """
-                INSERT INTO Users (Username) 
-                VALUES (%s)
-                """
-                self.cursor.execute(insert_query, (username,))
-                self.connection.commit()
-            else:
-                logging.info(f"Error: User is already in database with username: {username}.")
+            with self._cursor() as (connection, cursor):
+                userid = self._get_user_id(cursor, username)
+                if userid is None:
+                    logging.info(f"No user found, will insert user with username: '{username}'.")
+                    insert_query = """
+                    INSERT INTO Users (Username)
+                    VALUES (%s)
+                    """
+                    cursor.execute(insert_query, (username,))
+                    connection.commit()
+                    self._cache_put(username, cursor.lastrowid)
+                else:
+                    logging.info(f"Error: User is already in database with username: {username}.")
         except mysql.connector.Error as err:
             logging.error(f"Error fetching data: {err}")
             return None
-        
+
+    @timed_db
     def getUser(self,username):
         try:
-            find_user_query = "SELECT id FROM Users WHERE Username = %s"
-            self.cursor.execute(find_user_query, (username,))
-            result = self.cursor.fetchone()
-            if result:
+            with self._cursor() as (connection, cursor):
+                userid = self._get_user_id(cursor, username)
+            if userid is not None:
                 logging.info(f"Found user: {username}")
-                return result
+                return (userid,)
             else:
                 logging.info(f"user '{username}' not found in the database.")
                 return None
@@ -225,21 +855,42 @@ class SQLHandler:
             logging.error(f"Error fetching data: {err}")
             return None
     def close(self):
-        """Close the database connection."""
-        if self.cursor:
-            self.cursor.close()
-        if self.connection:
-            self.connection.close()
+        """Close all pooled database connections."""
+        while True:
+            try:
+                connection, _ = self.pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.close()
+            except mysql.connector.Error as err:
+                logging.error(f"Error closing connection: {err}")
+        self.opened = 0
         logging.info("Connection closed.")
 
 if __name__ == "__main__":
-    
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild-latest":
+        # One-off backfill of LatestModels using the same .env settings as Main.py
+        import dotenv
+        import os
+        dotenv.load_dotenv(dotenv.find_dotenv())
+        sql_handler = SQLHandler(
+            host=os.getenv("SQLHOST"),
+            user=os.getenv("DBUSER"),
+            password=os.getenv("DBPASSWORD"),
+            database=os.getenv("DBDB")
+        )
+        sql_handler.rebuild_latest_models()
+        sql_handler.close()
+        sys.exit(0)
+
     db_host = 'localhost'
     db_user = 'root'
     db_password = 'root_password'  
     db_name = 'test_db'  
 
-    
+
     sql_handler = SQLHandler(host=db_host, user=db_user, password=db_password, database=db_name)
 
     sql_handler.close()
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+import logging
+from Config import Config
+
+def default_plan():
+    """The plan the server ran before plans were configurable: one five hour phase after a ten second delay."""
+    return {
+        "name": "default",
+        "start_delay": 10,
+        "phases": [
+            {"name": "test", "duration": 5*60*60},
+        ],
+    }
+
+def load_plan(path):
+    """
+    Load an experiment plan from a JSON file.
+    A plan has a "name", an optional "start_delay" in seconds and a list of "phases". Each phase has a
+    "name" and a "duration" in seconds, and may set "seed", "iterations", "test_seed", "test_iterations",
+    "best_file" (falling back to SEED, MaxIterations, TestSED, TestMaxIterations and BestFilePath),
+    "users" ("all" or a list of usernames), "stop_before" and "stop_after".
+    """
+    with open(path) as f:
+        plan = json.load(f)
+    if not plan.get("phases"):
+        raise ValueError(f"Experiment plan {path} has no phases.")
+    for index, phase in enumerate(plan["phases"]):
+        if "duration" not in phase:
+            raise ValueError(f"Phase {index} of experiment plan {path} has no duration.")
+        phase.setdefault("name", f"phase-{index}")
+    plan.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return plan
+
+class Scheduler:
+    def __init__(self, mqtt_handler, stop_event, plan=None, state_path=None, db_handler=None, config=None):
+        """
+        Initialize the experiment scheduler.
+        :param mqtt_handler: Instance of MQTTHandler to send commands with.
+        :param stop_event: threading.Event that is set when the plan is done, and stops the plan early when set.
+        :param plan: The experiment plan, see load_plan. Defaults to default_plan().
+        :param state_path: JSON file progress is saved to, so a restart resumes mid-plan. Nothing is saved when None.
+        :param db_handler: Optional database handler phase timings are recorded with.
+        :param config: Shared Config the phase defaults are read from.
+        """
+        self.mqtthandler = mqtt_handler
+        self.stop_event = stop_event
+        self.plan = plan if plan else default_plan()
+        self.state_path = state_path
+        self.db_handler = db_handler
+        self.config = config if config else Config()
+        self.plan_hash = hashlib.sha256(json.dumps(self.plan, sort_keys=True).encode("utf-8")).hexdigest()
+        self.state = self.load_state()
+
+    def loop(self):
+        """Run the plan on the calling thread, waiting on stop_event between steps."""
+        while True:
+            delay = self.step()
+            if delay is None:
+                break
+            if self.stop_event.wait(delay):
+                logging.info("Experiment plan interrupted, progress is saved.")
+                return
+        self.stop_event.set()
+
+    async def run_async(self):
+        """Run the plan as a coroutine for the asyncio runtime; steps record to the database, so they run in the default executor."""
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = await loop.run_in_executor(None, self.step)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        self.stop_event.set()
+
+    def step(self):
+        """
+        Advance the plan by one step.
+        :return: Seconds to wait before the next step, or None when the plan is done.
+        """
+        phases = self.plan["phases"]
+        if not self.state["delay_done"]:
+            self.state["delay_done"] = True
+            self.save_state()
+            return float(self.plan.get("start_delay", 0))
+
+        index = self.state["phase_index"]
+        if index >= len(phases):
+            logging.info(f"Experiment plan '{self.plan['name']}' is done")
+            self.clear_state()
+            return None
+        phase = phases[index]
+
+        if self.state["phase_started_at"] is None:
+            self.start_phase(index, phase)
+            return float(phase["duration"])
+
+        remaining = self.state["phase_started_at"] + float(phase["duration"]) - time.time()
+        if remaining > 0:
+            logging.info(f"Resuming phase '{phase['name']}' with {remaining:.0f} seconds left")
+            return remaining
+
+        self.end_phase(index, phase)
+        return 0
+
+    def start_phase(self, index, phase):
+        """Send the phase's setup to its users and record its start."""
+        config = self.config.snapshot()
+        topics = self.topics_for(phase)
+
+        if phase.get("stop_before", True):
+            logging.info("Stopping all ongoing training")
+            for topic in topics:
+                self.mqtthandler.send_message(topic, "StopTrain|")
+
+        seed = phase.get("seed", config.get("SEED"))
+        maxit = phase.get("iterations", config.get("MaxIterations"))
+        testseed = phase.get("test_seed", config.get("TestSED"))
+        test_max_it = phase.get("test_iterations", config.get("TestMaxIterations"))
+        filename = phase.get("best_file", config.get("BestFilePath"))
+        payload = f"Setup|{maxit}|{seed}|{test_max_it}|{testseed}|{filename}"
+        logging.info(f"Starting phase '{phase['name']}' ({index + 1}/{len(self.plan['phases'])})")
+        for topic in topics:
+            self.mqtthandler.send_message(topic, payload)
+
+        self.state["phase_started_at"] = time.time()
+        self.state["phase_id"] = None
+        if self.db_handler:
+            self.state["phase_id"] = self.db_handler.record_phase_start(self.plan["name"], index, phase["name"])
+        self.save_state()
+
+    def end_phase(self, index, phase):
+        """Stop the phase's users and record its end."""
+        if phase.get("stop_after", True):
+            for topic in self.topics_for(phase):
+                self.mqtthandler.send_message(topic, "StopTrain|")
+        if self.db_handler and self.state.get("phase_id"):
+            self.db_handler.record_phase_end(self.state["phase_id"])
+        elapsed = time.time() - self.state["phase_started_at"]
+        logging.info(f"Phase '{phase['name']}' is done after {elapsed:.0f} seconds")
+
+        self.state["phase_index"] = index + 1
+        self.state["phase_started_at"] = None
+        self.state["phase_id"] = None
+        self.save_state()
+
+    def topics_for(self, phase):
+        """Return the command topics a phase targets."""
+        users = phase.get("users", "all")
+        if users == "all":
+            return ["all/Commands"]
+        return [f"{user}/Commands" for user in users]
+
+    def load_state(self):
+        """Load saved progress for this plan, or start from the beginning."""
+        fresh = {"plan_hash": self.plan_hash, "delay_done": False, "phase_index": 0, "phase_started_at": None, "phase_id": None}
+        if not self.state_path or not os.path.exists(self.state_path):
+            return fresh
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read experiment state {self.state_path}, starting over: {e}")
+            return fresh
+        if state.get("plan_hash") != self.plan_hash:
+            logging.info("Experiment plan changed since the saved state, starting over")
+            return fresh
+        if state.get("phase_index", 0) >= len(self.plan["phases"]):
+            # A finished plan whose state could not be removed is never resumed
+            logging.info(f"Experiment plan '{self.plan['name']}' already finished, starting over")
+            return fresh
+        logging.info(f"Resuming experiment plan '{self.plan['name']}' at phase {state['phase_index']}")
+        return state
+
+    def save_state(self):
+        """Atomically write the current progress to state_path."""
+        if not self.state_path:
+            return
+        state_dir = os.path.dirname(os.path.abspath(self.state_path))
+        fd, tmp_path = tempfile.mkstemp(dir=state_dir, prefix=".", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def clear_state(self):
+        """Remove the saved progress of a finished plan, so the next start runs it from the beginning."""
+        if not self.state_path:
+            return
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Could not remove experiment state {self.state_path}: {e}")
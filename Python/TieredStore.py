@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+import logging
+from ModelStore import ModelStore
+
+class TieredStore:
+    def __init__(self, root, hdfs_handler, archive_dir, budget_bytes, db_handler=None, durability="file", min_age=3600, check_interval=60):
+        """
+        Keep the local model store under a byte budget by archiving the least recently used blobs to HDFS.
+        Blobs of every user's newest model, blobs used in the last min_age seconds and blobs a protector
+        returns are never evicted. Evicted models are fetched back on demand with fetch().
+        :param root: Root directory of the ModelStore.
+        :param hdfs_handler: HDFSHandler blobs are archived with.
+        :param archive_dir: HDFS directory blobs are archived to as <archive_dir>/<hash>.
+        :param budget_bytes: Maximum bytes of blobs kept on local disk.
+        :param db_handler: Optional database handler; the hashes of the newest models are read from it.
+        :param durability: fsync policy for fetched blobs, one of "none", "file" or "full".
+        :param min_age: Seconds since the last use before a blob may be archived.
+        :param check_interval: Seconds between budget checks of the background thread.
+        """
+        self.model_store = ModelStore(root, durability)
+        self.hdfs_handler = hdfs_handler
+        self.archive_dir = archive_dir.rstrip("/")
+        self.budget_bytes = int(budget_bytes)
+        self.db_handler = db_handler
+        self.min_age = float(min_age)
+        self.check_interval = float(check_interval)
+        self.protectors = []
+        self.last_used = {}
+        # Shared with the store, so ingesting an upload and evicting its blob never interleave
+        self.lock = self.model_store.lock
+        self.fetch_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the background thread that enforces the budget."""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="TieredStore", daemon=True)
+        self.thread.start()
+        logging.info(f"TieredStore started with a budget of {self.budget_bytes} bytes, archiving to {self.archive_dir}")
+
+    def stop(self):
+        """Stop the background thread."""
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+        logging.info("TieredStore stopped.")
+
+    def run(self):
+        while self.running:
+            try:
+                self.enforce_budget()
+            except Exception as e:
+                logging.error(f"Error enforcing the model store budget: {e}")
+            self.wakeup.wait(self.check_interval)
+            self.wakeup.clear()
+
+    def add_protector(self, callback):
+        """Register a callable returning hashes that must stay local, like the currently promoted model."""
+        self.protectors.append(callback)
+
+    def touch(self, digest):
+        """Mark a blob as used now, and check the budget soon since it may be new."""
+        with self.lock:
+            self.last_used[digest] = time.time()
+        self.wakeup.set()
+
+    def archive_path(self, digest):
+        return f"{self.archive_dir}/{digest}"
+
+    def protected_hashes(self):
+        """Return the hashes that must not be evicted."""
+        protected = set()
+        if self.db_handler:
+            protected.update(model.get("model_hash") for model in self.db_handler.get_newest_models())
+        for callback in self.protectors:
+            protected.update(callback() or ())
+        protected.discard(None)
+        return protected
+
+    def scan(self):
+        """
+        Return the local blobs as {digest: (size, inode, mtime)} and the per-user links as {inode: [paths]}.
+        """
+        blobs = {}
+        for dirpath, _, filenames in os.walk(self.model_store.blob_dir):
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                stat = os.stat(os.path.join(dirpath, filename))
+                blobs[filename] = (stat.st_size, stat.st_ino, stat.st_mtime)
+        links = {}
+        for dirpath, dirnames, filenames in os.walk(self.model_store.root):
+            dirnames[:] = [name for name in dirnames if name != ".blobs"]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                links.setdefault(os.stat(path).st_ino, []).append(path)
+        return blobs, links
+
+    def enforce_budget(self):
+        """Archive and evict least recently used blobs until the local store fits the budget."""
+        blobs, links = self.scan()
+        total = sum(size for size, _, _ in blobs.values())
+        if total <= self.budget_bytes:
+            return
+        protected = self.protected_hashes()
+        now = time.time()
+        with self.lock:
+            last_used = {digest: self.last_used.get(digest, mtime) for digest, (_, _, mtime) in blobs.items()}
+
+        for digest in sorted(blobs, key=last_used.get):
+            if total <= self.budget_bytes:
+                break
+            if digest in protected or now - last_used[digest] < self.min_age:
+                continue
+            size, inode, _ = blobs[digest]
+            if self.evict(digest, links.get(inode, [])):
+                total -= size
+        if total > self.budget_bytes:
+            logging.info(f"Model store holds {total} bytes, over its budget of {self.budget_bytes}, but nothing else can be archived yet")
+
+    def evict(self, digest, paths):
+        """
+        Archive a blob to HDFS and remove it and its per-user links from local disk.
+        :return: True if the blob was removed locally.
+        """
+        blob = self.model_store.blob_path(digest)
+        archive_path = self.archive_path(digest)
+        if not self.hdfs_handler.file_exists(archive_path) and not self.hdfs_handler.upload_file(blob, archive_path):
+            logging.error(f"Could not archive blob {digest}, keeping it local")
+            return False
+        with self.lock:
+            if time.time() - self.last_used.get(digest, 0) < self.min_age:
+                # Fetched or uploaded again while it was being archived
+                return False
+            if os.stat(blob).st_nlink > len(paths) + 1:
+                # Linked by an upload since the scan, before it was touched
+                return False
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            os.remove(blob)
+            self.last_used.pop(digest, None)
+        logging.info(f"Archived blob {digest} to {archive_path}, removed {len(paths)} local links")
+        return True
+
+    def fetch(self, username, file_name, digest):
+        """
+        Make sure a model is on local disk, downloading its blob from the archive if it was evicted.
+        :param digest: SHA-256 of the model, as recorded in ModelFiles.
+        :return: The local path of the model, or None if it could not be restored.
+        """
+        dest_path = self.model_store.user_path(username, file_name)
+        if os.path.isfile(dest_path):
+            if digest:
+                self.touch(digest)
+            return dest_path
+        if not digest:
+            logging.error(f"Model {file_name} of {username} is not local and its hash is unknown")
+            return None
+
+        blob = self.model_store.blob_path(digest)
+        with self.fetch_lock:
+            with self.lock:
+                if os.path.exists(blob):
+                    self.last_used[digest] = time.time()
+                    return self.model_store.link(digest, username, file_name)
+
+            # Download without holding the lock, so uploads can still be recorded meanwhile
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp_path = os.path.join(self.model_store.blob_dir, f".{digest}.fetch")
+            logging.info(f"Fetching archived model {file_name} of {username} from {self.archive_path(digest)}")
+            if not self.hdfs_handler.download_file(self.archive_path(digest), tmp_path):
+                return None
+            os.chmod(tmp_path, 0o444)
+            with self.lock:
+                os.replace(tmp_path, blob)
+                self.last_used[digest] = time.time()
+                return self.model_store.link(digest, username, file_name)
@@ -0,0 +1,106 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Codec
+
+
+class DecodeTest(unittest.TestCase):
+    def test_legacy_message(self):
+        self.assertEqual(Codec.decode(b"NewUser|alice"), [("NewUser", "alice")])
+
+    def test_legacy_data_keeps_separators(self):
+        self.assertEqual(Codec.decode("TestResultat|m.zip|1.5|0.25"), [("TestResultat", "m.zip|1.5|0.25")])
+
+    def test_legacy_without_separator_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Codec.decode(b"NewUser")
+
+    def test_empty_payload_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Codec.decode(b"")
+
+    def test_json_object_and_batch(self):
+        self.assertEqual(Codec.decode(b'{"v":1,"cmd":"NewUser","data":"bob"}'), [("NewUser", "bob")])
+        batch = b'[{"cmd":"LoopStarted"},{"cmd":"TestResultat","results":[["m.zip",1,2]]}]'
+        self.assertEqual(Codec.decode(batch), [("LoopStarted", ""), ("TestResultat", [["m.zip", 1, 2]])])
+
+    def test_invalid_structured_messages_are_rejected(self):
+        for payload in (
+            b'{"cmd":"NewUser"',
+            b'{"data":"x"}',
+            b'{"cmd":5}',
+            b'{"v":2,"cmd":"NewUser"}',
+            b'{"cmd":"TestResultat","results":"m.zip|1|2"}',
+            b'[1,2]',
+        ):
+            with self.subTest(payload=payload):
+                with self.assertRaises(ValueError):
+                    Codec.decode(payload)
+
+    def test_decode_data(self):
+        self.assertEqual(Codec.decode_data(b"alice"), "alice")
+        self.assertEqual(Codec.decode_data('{"cmd":"x"}'), '{"cmd":"x"}')
+        self.assertEqual(Codec.decode_data(b'{"results":[["m.zip",1,2]]}'), [["m.zip", 1, 2]])
+        self.assertEqual(Codec.decode_data(b'{"data":"bob"}'), "bob")
+        with self.assertRaises(ValueError):
+            Codec.decode_data(b'{"v":9,"data":"bob"}')
+
+
+class ParseResultsTest(unittest.TestCase):
+    def test_legacy_string(self):
+        self.assertEqual(Codec.parse_results("m.zip|1.5|0.25"), [("m.zip", 1.5, 0.25)])
+
+    def test_legacy_string_with_missing_fields(self):
+        with self.assertRaises(ValueError):
+            Codec.parse_results("m.zip|1.5")
+
+    def test_list_entries_skip_invalid_ones(self):
+        data = [
+            {"file": "a.zip", "mean": "1", "std": 2},
+            ["b.zip", 3, 4],
+            {"file": "c.zip", "mean": 1},
+            ["d.zip", "x", 1],
+            ["e.zip", float("nan"), 1],
+            ["f.zip", 1, float("inf")],
+        ]
+        with self.assertLogs(level="ERROR"):
+            results = Codec.parse_results(data)
+        self.assertEqual(results, [("a.zip", 1.0, 2.0), ("b.zip", 3.0, 4.0)])
+
+    def test_non_finite_legacy_reward_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Codec.parse_results("m.zip|nan|1")
+
+
+class EncodeTest(unittest.TestCase):
+    def test_json_round_trip(self):
+        payload = Codec.encode("TestResultat", results=[("m.zip", 1.5, 0.25)])
+        command, data = Codec.decode(payload)[0]
+        self.assertEqual(command, "TestResultat")
+        self.assertEqual(Codec.parse_results(data), [("m.zip", 1.5, 0.25)])
+
+    def test_legacy_round_trip(self):
+        payload = Codec.encode("TestResultat", results=[("m.zip", 1.5, 0.25)], fmt="legacy")
+        self.assertEqual(payload, b"TestResultat|m.zip|1.5|0.25")
+        command, data = Codec.decode(payload)[0]
+        self.assertEqual(Codec.parse_results(data), [("m.zip", 1.5, 0.25)])
+
+    def test_legacy_holds_one_result(self):
+        with self.assertRaises(ValueError):
+            Codec.encode("TestResultat", results=[("a", 1, 1), ("b", 2, 2)], fmt="legacy")
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            Codec.encode("NewUser", "alice", fmt="xml")
+
+    @unittest.skipIf(Codec.msgpack is None, "msgpack is not installed")
+    def test_msgpack_round_trip(self):
+        payload = Codec.encode("NewUser", "alice", fmt="msgpack")
+        self.assertEqual(Codec.decode(payload), [("NewUser", "alice")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Dispatcher import CommandDispatcher, Lane, parse_lanes, parse_routes
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse_lanes(self):
+        self.assertEqual(parse_lanes("default:4:1000:block, fast:1:100:drop_oldest,"), {
+            "default": {"workers": 4, "queue_size": 1000, "policy": "block"},
+            "fast": {"workers": 1, "queue_size": 100, "policy": "drop_oldest"},
+        })
+        self.assertEqual(parse_lanes(""), {})
+
+    def test_parse_routes(self):
+        self.assertEqual(parse_routes("LoopStarted:fast, LoopStopped:fast"), {"LoopStarted": "fast", "LoopStopped": "fast"})
+        self.assertEqual(parse_routes(None), {})
+
+    def test_unknown_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Lane("default", policy="spill")
+
+    def test_route_to_unknown_lane_is_rejected(self):
+        with self.assertRaises(ValueError):
+            CommandDispatcher(routes={"NewUser": "missing"})
+
+
+class OrderingTest(unittest.TestCase):
+    def test_commands_of_one_user_run_in_order(self):
+        dispatcher = CommandDispatcher({"default": {"workers": 4, "queue_size": 1000}})
+        seen = {}
+        seen_lock = threading.Lock()
+
+        def handler(username, index):
+            with seen_lock:
+                seen.setdefault(username, []).append(index)
+
+        dispatcher.start()
+        users = [f"user{number}" for number in range(8)]
+        for index in range(200):
+            for username in users:
+                self.assertTrue(dispatcher.submit("TestResultat", username, handler, username, index))
+        dispatcher.stop()
+
+        self.assertEqual(sorted(seen), users)
+        for username in users:
+            self.assertEqual(seen[username], list(range(200)))
+        stats = dispatcher.stats()["default"]
+        self.assertEqual(stats["processed"], 1600)
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_routes_pick_the_lane(self):
+        dispatcher = CommandDispatcher({"fast": {"workers": 1}}, {"LoopStarted": "fast"})
+        lanes = []
+        dispatcher.start()
+        dispatcher.submit("LoopStarted", "alice", lambda: lanes.append(threading.current_thread().name.rsplit("-", 1)[0]))
+        dispatcher.submit("NewUser", "alice", lambda: lanes.append(threading.current_thread().name.rsplit("-", 1)[0]))
+        dispatcher.stop()
+        self.assertEqual(sorted(lanes), ["Dispatch-default", "Dispatch-fast"])
+
+    def test_handler_errors_are_counted(self):
+        dispatcher = CommandDispatcher({"default": {"workers": 1}})
+        ran = []
+
+        def fail():
+            raise RuntimeError("boom")
+
+        dispatcher.start()
+        with self.assertLogs(level="ERROR"):
+            dispatcher.submit("NewUser", "alice", fail)
+            dispatcher.submit("NewUser", "alice", ran.append, 1)
+            dispatcher.stop()
+        self.assertEqual(ran, [1])
+        self.assertEqual(dispatcher.stats()["default"]["errors"], 1)
+
+
+class OverflowTest(unittest.TestCase):
+    def test_reject_policy(self):
+        lane = Lane("default", workers=1, queue_size=2, policy="reject")
+        ran = []
+        self.assertTrue(lane.submit("alice", ran.append, (1,)))
+        self.assertTrue(lane.submit("alice", ran.append, (2,)))
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(lane.submit("alice", ran.append, (3,)))
+        lane.start()
+        lane.stop()
+        self.assertEqual(ran, [1, 2])
+        stats = lane.stats()
+        self.assertEqual((stats["submitted"], stats["rejected"], stats["dropped"]), (2, 1, 0))
+
+    def test_drop_oldest_policy(self):
+        lane = Lane("default", workers=1, queue_size=2, policy="drop_oldest")
+        ran = []
+        for index in range(1, 5):
+            self.assertTrue(lane.submit("alice", ran.append, (index,)))
+        self.assertEqual(lane.stats()["queue_depth"], 2)
+        lane.start()
+        lane.stop()
+        self.assertEqual(ran, [3, 4])
+        stats = lane.stats()
+        self.assertEqual((stats["submitted"], stats["rejected"], stats["dropped"]), (4, 0, 2))
+
+    def test_block_policy_rejects_after_timeout(self):
+        lane = Lane("default", workers=1, queue_size=1, policy="block", block_timeout=0.05)
+        self.assertTrue(lane.submit("alice", lambda: None, ()))
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(lane.submit("alice", lambda: None, ()))
+        self.assertEqual(lane.stats()["rejected"], 1)
+
+    def test_block_policy_waits_for_room(self):
+        lane = Lane("default", workers=1, queue_size=1, policy="block", block_timeout=5)
+        release = threading.Event()
+        started = threading.Event()
+        ran = []
+        accepted = []
+
+        def wait():
+            started.set()
+            release.wait(5)
+
+        lane.start()
+        lane.submit("alice", wait, ())
+        started.wait(5)
+        lane.submit("alice", ran.append, (1,))
+        submitter = threading.Thread(target=lambda: accepted.append(lane.submit("alice", ran.append, (2,))))
+        submitter.start()
+        submitter.join(0.1)
+        self.assertTrue(submitter.is_alive())
+        release.set()
+        submitter.join(5)
+        lane.stop()
+        self.assertEqual(accepted, [True])
+        self.assertEqual(ran, [1, 2])
+        self.assertEqual(lane.stats()["rejected"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
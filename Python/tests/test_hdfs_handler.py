@@ -0,0 +1,190 @@
+import io
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import contextlib
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HDFSHandler import HDFSHandler, CHECKSUM_SUFFIX, PART_SUFFIX
+
+
+class FakeWebHDFS:
+    """In-memory stand-in for the parts of hdfs.InsecureClient the handler uses."""
+
+    def __init__(self):
+        self.files = {}
+        self.lock = threading.Lock()
+        self.appended = 0
+        self.reads = []
+        # Byte length of a file at which the next append fails, optionally after it was applied
+        self.fail_at = None
+        self.fail_after_write = False
+
+    def status(self, path, strict=True):
+        with self.lock:
+            if path in self.files:
+                return {"length": len(self.files[path]), "modificationTime": 1, "type": "FILE"}
+        if strict:
+            raise IOError(f"{path} not found")
+        return None
+
+    def write(self, path, data=None, overwrite=False, append=False, encoding=None):
+        if isinstance(data, str):
+            data = data.encode(encoding or "utf-8")
+        with self.lock:
+            if append:
+                fail = self.fail_at is not None and len(self.files[path]) >= self.fail_at
+                if fail and not self.fail_after_write:
+                    self.fail_at = None
+                    raise IOError("connection reset")
+                self.files[path] += data
+                self.appended += len(data)
+                if fail:
+                    self.fail_at = None
+                    raise IOError("response lost")
+            else:
+                if path in self.files and not overwrite:
+                    raise IOError(f"{path} exists")
+                self.files[path] = bytes(data)
+
+    def rename(self, source, destination):
+        with self.lock:
+            self.files[destination] = self.files.pop(source)
+
+    def delete(self, path, recursive=False):
+        with self.lock:
+            return self.files.pop(path, None) is not None
+
+    def makedirs(self, path):
+        pass
+
+    @contextlib.contextmanager
+    def read(self, path, offset=0, length=None, encoding=None):
+        with self.lock:
+            data = self.files[path][offset:offset + length if length else None]
+            self.reads.append((path, offset))
+        yield io.StringIO(data.decode(encoding)) if encoding else io.BytesIO(data)
+
+    def walk(self, root, status=False):
+        with self.lock:
+            files = [(path.rsplit("/", 1)[1], {"length": len(data)}) for path, data in self.files.items() if path.rsplit("/", 1)[0] == root]
+        yield (root, {}), [], files
+
+
+class HDFSHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.client = FakeWebHDFS()
+        self.handler = HDFSHandler("http://namenode:50070", "hdfs", streams=4, chunk_size=1000, client=self.client)
+        self.data = os.urandom(10500)
+        self.local_path = self.local("model.zip", self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def local(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def assertUploaded(self, hdfs_path):
+        self.assertEqual(self.client.files[hdfs_path], self.data)
+        self.assertEqual(self.client.files[hdfs_path + CHECKSUM_SUFFIX].decode(), hashlib.sha256(self.data).hexdigest())
+        self.assertNotIn(hdfs_path + PART_SUFFIX, self.client.files)
+
+    def test_upload(self):
+        self.assertTrue(self.handler.upload_file(self.local_path, "/m/model.zip"))
+        self.assertUploaded("/m/model.zip")
+        self.assertEqual(self.client.appended, len(self.data))
+
+    def test_upload_without_overwrite_keeps_existing_file(self):
+        self.client.files["/m/model.zip"] = b"old"
+        self.assertFalse(self.handler.upload_file(self.local_path, "/m/model.zip", overwrite=False))
+        self.assertEqual(self.client.files["/m/model.zip"], b"old")
+
+    def test_upload_resumes_matching_part(self):
+        self.client.files["/m/model.zip" + PART_SUFFIX] = self.data[:3000]
+        self.assertTrue(self.handler.upload_file(self.local_path, "/m/model.zip"))
+        self.assertUploaded("/m/model.zip")
+        self.assertEqual(self.client.appended, len(self.data) - 3000)
+
+    def test_upload_restarts_stale_part(self):
+        self.client.files["/m/model.zip" + PART_SUFFIX] = os.urandom(3000)
+        self.assertTrue(self.handler.upload_file(self.local_path, "/m/model.zip"))
+        self.assertUploaded("/m/model.zip")
+        self.assertEqual(self.client.appended, len(self.data))
+
+    def test_upload_restarts_part_longer_than_file(self):
+        self.client.files["/m/model.zip" + PART_SUFFIX] = self.data + b"tail"
+        self.assertTrue(self.handler.upload_file(self.local_path, "/m/model.zip"))
+        self.assertUploaded("/m/model.zip")
+
+    def test_upload_retries_failed_append(self):
+        self.client.fail_at = 5000
+        self.assertTrue(self.handler.upload_file(self.local_path, "/m/model.zip"))
+        self.assertUploaded("/m/model.zip")
+
+    def test_upload_does_not_repeat_append_with_lost_response(self):
+        self.client.fail_at = 5000
+        self.client.fail_after_write = True
+        self.assertTrue(self.handler.upload_file(self.local_path, "/m/model.zip"))
+        self.assertUploaded("/m/model.zip")
+        self.assertEqual(self.client.appended, len(self.data))
+
+    def test_download(self):
+        self.handler.upload_file(self.local_path, "/m/model.zip")
+        target = os.path.join(self.dir, "out", "model.zip")
+        self.assertTrue(self.handler.download_file("/m/model.zip", target))
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(target))), ["model.zip"])
+
+    def test_download_with_bad_checksum_is_discarded(self):
+        self.handler.upload_file(self.local_path, "/m/model.zip")
+        self.client.files["/m/model.zip"] = b"x" + self.data[1:]
+        target = os.path.join(self.dir, "out", "model.zip")
+        self.assertFalse(self.handler.download_file("/m/model.zip", target))
+        self.assertEqual(os.listdir(os.path.dirname(target)), [])
+
+    def test_download_resumes_finished_ranges(self):
+        self.handler.upload_file(self.local_path, "/m/model.zip")
+        target = os.path.join(self.dir, "out", "model.zip")
+        os.makedirs(os.path.dirname(target))
+        part_path = target + PART_SUFFIX
+        with open(part_path, "wb") as f:
+            f.write(self.data[:5000] + bytes(len(self.data) - 5000))
+        with open(part_path + ".json", "w") as f:
+            json.dump({"length": len(self.data), "modified": 1, "chunk_size": 1000, "done": list(range(0, 5000, 1000))}, f)
+
+        self.assertTrue(self.handler.download_file("/m/model.zip", target))
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        offsets = sorted(offset for path, offset in self.client.reads if path == "/m/model.zip")
+        self.assertEqual(offsets, list(range(5000, len(self.data), 1000)))
+
+    def test_directory_round_trip(self):
+        source = os.path.join(self.dir, "source")
+        os.makedirs(source)
+        files = {"a.zip": os.urandom(2500), "b.zip": os.urandom(10), "c.zip.part": b"skip"}
+        for name, data in files.items():
+            with open(os.path.join(source, name), "wb") as f:
+                f.write(data)
+
+        self.assertTrue(self.handler.upload_directory(source, "/m"))
+        target = os.path.join(self.dir, "target")
+        self.assertTrue(self.handler.download_directory("/m", target))
+        self.assertEqual(sorted(os.listdir(target)), ["a.zip", "b.zip"])
+        for name in ("a.zip", "b.zip"):
+            with open(os.path.join(target, name), "rb") as f:
+                self.assertEqual(f.read(), files[name])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ModelServer import parse_range
+
+
+class ParseRangeTest(unittest.TestCase):
+    def test_no_header_sends_whole_file(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertIsNone(parse_range("", 100))
+
+    def test_closed_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range(" bytes=10-10 ", 100), (10, 10))
+
+    def test_end_is_clamped_to_size(self):
+        self.assertEqual(parse_range("bytes=90-500", 100), (90, 99))
+
+    def test_open_range(self):
+        self.assertEqual(parse_range("bytes=40-", 100), (40, 99))
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-500", 100), (0, 99))
+
+    def test_unsatisfiable_ranges(self):
+        self.assertIs(parse_range("bytes=100-", 100), False)
+        self.assertIs(parse_range("bytes=50-40", 100), False)
+        self.assertIs(parse_range("bytes=-0", 100), False)
+
+    def test_malformed_or_multiple_ranges_send_whole_file(self):
+        for header in ("bytes=-", "bytes=0-1,5-6", "items=0-1", "bytes=a-b"):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 100))
+
+    def test_empty_file_ignores_range(self):
+        self.assertIsNone(parse_range("bytes=0-", 0))
+        self.assertIsNone(parse_range("bytes=-5", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
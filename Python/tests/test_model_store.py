@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ModelStore import ModelStore
+
+
+class ModelStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = ModelStore(os.path.join(self.dir, "models"), durability="none", chunk_size=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def upload(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_ingest_links_blob_under_user(self):
+        data = os.urandom(4500)
+        src = self.upload("upload.zip", data)
+        digest, size, deduplicated = self.store.ingest(src, "alice", "model1.zip")
+
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        self.assertEqual(size, len(data))
+        self.assertFalse(deduplicated)
+        self.assertFalse(os.path.exists(src))
+        with open(self.store.user_path("alice", "model1.zip"), "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertTrue(os.path.samefile(self.store.blob_path(digest), self.store.user_path("alice", "model1.zip")))
+
+    def test_duplicate_shares_blob(self):
+        data = os.urandom(4500)
+        first, _, _ = self.store.ingest(self.upload("a.zip", data), "alice", "model1.zip")
+        second, _, deduplicated = self.store.ingest(self.upload("b.zip", data), "bob", "model7.zip")
+
+        self.assertEqual(first, second)
+        self.assertTrue(deduplicated)
+        blob = self.store.blob_path(first)
+        self.assertEqual(os.stat(blob).st_nlink, 3)
+        self.assertTrue(os.path.samefile(blob, self.store.user_path("bob", "model7.zip")))
+
+    def test_different_content_gets_own_blob(self):
+        first, _, _ = self.store.ingest(self.upload("a.zip", b"one"), "alice", "model1.zip")
+        second, _, deduplicated = self.store.ingest(self.upload("b.zip", b"two"), "alice", "model2.zip")
+        self.assertNotEqual(first, second)
+        self.assertFalse(deduplicated)
+
+    def test_link_restores_user_path(self):
+        digest, _, _ = self.store.ingest(self.upload("a.zip", b"model"), "alice", "model1.zip")
+        os.remove(self.store.user_path("alice", "model1.zip"))
+        path = self.store.link(digest, "alice", "model1.zip")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"model")
+
+    def test_unknown_durability_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ModelStore(os.path.join(self.dir, "other"), durability="sometimes")
+
+
+if __name__ == "__main__":
+    unittest.main()